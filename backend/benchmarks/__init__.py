@@ -0,0 +1,2 @@
+# benchmarks - standalone performance scripts, run from backend/ with
+# `python -m benchmarks.<name>` (not part of the app)
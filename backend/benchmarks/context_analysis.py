@@ -0,0 +1,143 @@
+# context_analysis.py - ContextManager keyword analysis on long histories
+
+"""
+Times the ContextManager text-analysis hot paths (search context, current
+topic, conversation summary, budget packing) on a 10k-message history,
+against the previous list-based implementations kept below for reference.
+
+    cd backend && python -m benchmarks.context_analysis [--messages 10000] [--rounds 20]
+
+"Cold" is the first turn (every message analyzed once); "warm" is the
+per-turn cost afterwards, when analyses come from the cache.
+"""
+
+import argparse
+import random
+import re
+import time
+
+from services import text_analysis
+from services.context_manager import ContextManager
+from services.messages import from_legacy
+
+WORDS = (
+    "quantum neural network photon entropy research paper model data learning climate energy "
+    "protein genome market policy graph vector theory experiment result method analysis"
+).split()
+
+
+def make_history(n: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    history = []
+    for i in range(n):
+        if i % 2 == 0:
+            words = rng.sample(WORDS, rng.randint(2, 8))
+            history.append(f"what about {' '.join(words)}?")
+        else:
+            history.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 160))) + ".")
+    # Ends with a short exchange, so topic lookups have to scan back
+    history[-2:] = ["ok", "sure"]
+    return history
+
+
+# ---- previous implementations ----------------------------------------
+
+def legacy_topic(history):
+    for i in range(len(history) - 2, -1, -2):
+        msg = history[i].strip()
+        if len(msg.split()) > 3:
+            words = msg.lower().split()
+            filtered_words = [w for w in words if w not in ['what', 'how', 'why', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'can', 'could', 'would', 'should', 'tell', 'me', 'you', 'i', 'we', 'they']]
+            if filtered_words:
+                return ' '.join(filtered_words[:4])
+    return ""
+
+
+def legacy_key_terms(text):
+    important_words = []
+    for word in text.lower().split():
+        word = re.sub(r'[^a-zA-Z]', '', word)
+        if len(word) > 3 and word not in ['what', 'how', 'why', 'when', 'where', 'would', 'could', 'should', 'about', 'explain', 'tell']:
+            important_words.append(word)
+    return ' '.join(important_words[:2]) if important_words else ""
+
+
+def legacy_summary(history):
+    topics = []
+    for i in range(0, len(history), 2):
+        msg = history[i].strip()
+        if len(msg.split()) > 3:
+            topic = legacy_key_terms(msg)
+            if topic:
+                topics.append(topic)
+    return f"Discussing: {', '.join(topics[:3])}" if topics else "General conversation"
+
+
+def legacy_search_context(history):
+    context_messages = []
+    for i in range(len(history) - 2, -1, -2):
+        msg = history[i].strip()
+        if (len(msg.split()) > 3 and
+                (msg.endswith('?') or
+                 any(keyword in msg.lower() for keyword in ['about', 'explain', 'what', 'how', 'why', 'tell me']) or
+                 len(msg) > 20)):
+            context_messages.extend([msg, history[i + 1]])
+            break
+    for msg in history[-4:]:
+        if msg not in context_messages:
+            context_messages.append(msg)
+    return context_messages[-6:]
+
+
+def legacy_terms(history):
+    return [set(re.findall(r"[a-z0-9]{4,}", msg.lower())) for msg in history[-50:]]
+
+
+def legacy_turn(history):
+    legacy_search_context(history)
+    legacy_topic(history)
+    legacy_summary(history)
+    legacy_terms(history)
+
+
+def current_turn(cm: ContextManager, history):
+    cm._get_smart_search_context(history, "")
+    cm._extract_current_topic(history)
+    cm.get_conversation_summary(history)
+    [cm._terms(msg.content) for msg in history[-50:]]
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    history = make_history(args.messages)
+    messages = from_legacy(history)
+    cm = ContextManager()
+    # Same answers as before
+    assert legacy_topic(history) == cm._extract_current_topic(messages)
+    assert legacy_summary(history) == cm.get_conversation_summary(messages)
+    assert legacy_search_context(history) == [m.content for m in cm._get_smart_search_context(messages, "")]
+    text_analysis.analyze.cache_clear()
+
+    cold = timed(lambda: current_turn(cm, messages), 1)
+    warm = timed(lambda: current_turn(cm, messages), args.rounds)
+    legacy = timed(lambda: legacy_turn(history), args.rounds)
+
+    print(f"{args.messages} messages, {args.rounds} rounds")
+    print(f"  legacy           {legacy:8.2f} ms/turn")
+    print(f"  analyzer (cold)  {cold:8.2f} ms/turn")
+    print(f"  analyzer (warm)  {warm:8.2f} ms/turn   ({legacy / warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# fake_llm.py - local OpenAI-compatible stand-in for the NGU endpoint
+
+"""
+Serves POST /v1/chat/completions (plain and "stream": true) with
+configurable latency and generation speed, so the backend can be load
+tested without the real LLM:
+
+    cd backend && python -m benchmarks.fake_llm --port 8765 --latency 0.3 --token-rate 400
+
+then run the backend with NGU_BASE_URL=http://127.0.0.1:8765/v1.
+
+Replies are deterministic for a given prompt. They have the shape each
+caller parses: "no" for self-correction judgements, a JSON array for the
+visualization prompt, two parallel Search actions and then a Final Answer
+for the ReAct agent, and `--tokens` words of filler text otherwise.
+Responses report `usage` token counts (words, in this stand-in).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.3"))      # seconds before the first token
+FAKE_LLM_TOKEN_RATE = float(os.getenv("FAKE_LLM_TOKEN_RATE", "400"))  # tokens per second, 0 = instant
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "120"))            # length of a free-text reply
+
+WORDS = (
+    "research model data analysis result method evidence study finding approach system network "
+    "learning signal energy policy protein climate theory experiment sample measure effect"
+).split()
+
+config = {"latency": FAKE_LLM_LATENCY, "token_rate": FAKE_LLM_TOKEN_RATE, "tokens": FAKE_LLM_TOKENS}
+app = FastAPI(title="Fake LLM")
+
+
+def reply_for(messages: list) -> str:
+    last = messages[-1]["content"] if messages else ""
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    if last.startswith("Evaluate"):
+        return "no"
+    if "Return ONLY a JSON array" in last:
+        return '[{"label": "Model Accuracy", "count": 8}, {"label": "Training Data", "count": 6}, ' \
+               '{"label": "Evaluation Methods", "count": 4}]'
+    if "ReAct" in system:
+        if last.startswith("Observation") or last.startswith("Now provide a Final Answer"):
+            return "Thought: The observations cover the question.\nFinal Answer: The sources agree on the main points."
+        topic = last[:60].replace('"', "").replace("]", "")
+        return (f'Thought: I should look at both sides of this.\nAction: Search["{topic} benefits"]\n'
+                f'Action: Search["{topic} limitations"]')
+    rng = random.Random(last)
+    return " ".join(rng.choice(WORDS) for _ in range(config["tokens"]))
+
+
+def _usage(messages: list, reply: str) -> dict:
+    prompt = sum(len(str(m.get("content", "")).split()) for m in messages)
+    completion = len(reply.split())
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    messages = body.get("messages") or []
+    reply = reply_for(messages)
+    words = reply.split(" ")
+    rate = config["token_rate"]
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(config["latency"])
+            for i, word in enumerate(words):
+                if i and rate:
+                    await asyncio.sleep(1 / rate)
+                chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": _usage(messages, reply)}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(config["latency"] + (len(words) / rate if rate else 0))
+    return {
+        "id": "fake",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": _usage(messages, reply),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=FAKE_LLM_LATENCY)
+    parser.add_argument("--token-rate", type=float, default=FAKE_LLM_TOKEN_RATE)
+    parser.add_argument("--tokens", type=int, default=FAKE_LLM_TOKENS)
+    args = parser.parse_args()
+    config.update(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
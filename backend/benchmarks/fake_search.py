@@ -0,0 +1,33 @@
+# fake_search.py - offline stand-in for the DuckDuckGo search provider
+
+"""
+Deterministic search results after a fixed delay, for benchmarks:
+
+    SEARCH_PROVIDER=benchmarks.fake_search:FakeSearchProvider
+    FAKE_SEARCH_LATENCY=0.4   # seconds per query
+"""
+
+import asyncio
+import os
+import re
+
+FAKE_SEARCH_LATENCY = float(os.getenv("FAKE_SEARCH_LATENCY", "0.4"))
+
+
+class FakeSearchProvider:
+    def __init__(self, latency: float = FAKE_SEARCH_LATENCY):
+        self.latency = latency
+        self.queries = 0
+
+    async def text(self, query: str, max_results: int = 5) -> list:
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-") or "query"
+        return [
+            {
+                "title": f"{query} - source {i + 1}",
+                "href": f"https://example.org/{slug}/{i + 1}",
+                "body": f"Result {i + 1} for {query}: an overview of the main findings, methods and open questions.",
+            }
+            for i in range(max_results)
+        ]
@@ -0,0 +1,348 @@
+# load_test.py - end-to-end throughput and latency of the backend API
+
+"""
+Starts the fake LLM (benchmarks.fake_llm) and the backend in subprocesses,
+with the fake search provider and a fresh data directory, then drives the
+HTTP API at each concurrency level and reports p50/p95/p99 latency,
+requests/sec and errors per workload:
+
+  chat           POST /chat/message
+  tool:<name>    POST /tools/use, for every tool
+  upload:<n>p    POST /tools/upload with a generated n-page PDF, polled
+                 until the ingestion job finishes (each upload has unique
+                 bytes, so the artifact cache does not short-circuit it)
+  note_save, note_list, note_delete
+
+    cd backend && python -m benchmarks.load_test [--concurrency 1,4,16] [--requests 32]
+    cd backend && python -m benchmarks.load_test --workloads chat,tool:search --compare old.json
+
+Results are written as JSON (default benchmarks/results/<commit>-<time>.json)
+together with the commit and settings, so runs can be compared across
+commits with --compare.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+TOOLS = ("summarize", "qa", "search", "clarify", "visualize", "react_agent", "generate_topic", "export_pdf")
+NOTE_WORKLOADS = ("note_save", "note_list", "note_delete")
+UPLOAD_POLL_INTERVAL = 0.02
+
+TOPICS = (
+    "transformer attention mechanisms", "protein folding prediction", "carbon capture materials",
+    "quantum error correction", "graph neural networks", "battery electrolyte chemistry",
+)
+
+
+def prompt(i: int) -> str:
+    return f"What are the main open questions in {TOPICS[i % len(TOPICS)]}, and how are they studied? ({i})"
+
+
+# ---- generated inputs --------------------------------------------------------
+
+def make_pdf(path: str, pages: int):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=letter)
+    for page in range(pages):
+        y = 720
+        for line in range(40):
+            topic = TOPICS[(page + line) % len(TOPICS)]
+            c.drawString(72, y, f"Page {page + 1}, line {line + 1}: findings on {topic} and their limitations.")
+            y -= 16
+        c.showPage()
+    c.save()
+
+
+# ---- workloads ---------------------------------------------------------------
+# Each workload is an async fn(client, i, worker) that makes one request and
+# raises on failure.
+
+def chat_workload():
+    async def run(client, i, worker):
+        r = await client.post("/chat/message", json={"user_id": f"bench-chat-{worker}", "message": prompt(i)})
+        r.raise_for_status()
+    return run
+
+
+def tool_workload(tool_name: str):
+    async def run(client, i, worker):
+        r = await client.post("/tools/use", json={
+            "user_id": f"bench-tool-{worker}", "tool_name": tool_name, "input_text": prompt(i),
+        })
+        r.raise_for_status()
+        result = r.json().get("result")
+        if isinstance(result, dict) and "error" in result:
+            raise RuntimeError(result["error"])
+    return run
+
+
+def upload_workload(pdf_bytes: bytes, pages: int):
+    async def run(client, i, worker):
+        # A trailing comment after %%EOF makes every upload's hash unique
+        data = pdf_bytes + f"\n%bench {time.time_ns()} {i}\n".encode()
+        r = await client.post("/tools/upload", data={"user_id": f"bench-upload-{worker}"},
+                              files={"file": (f"paper-{pages}p-{i}.pdf", data, "application/pdf")})
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            await asyncio.sleep(UPLOAD_POLL_INTERVAL)
+            job = (await client.get(f"/tools/upload/{job_id}")).json()
+            if job["status"] == "done":
+                return
+            if job["status"] not in ("queued", "running"):
+                raise RuntimeError(job.get("error") or job["status"])
+    return run
+
+
+def note_workload(name: str):
+    async def run(client, i, worker):
+        user_id = f"bench-note-{worker}"
+        if name == "note_save":
+            r = await client.post("/tools/note/save", data={"user_id": user_id, "note": prompt(i)})
+        elif name == "note_list":
+            r = await client.get("/tools/note/list", params={"user_id": user_id})
+        else:
+            r = await client.post("/tools/note/delete", data={"user_id": user_id, "index": 0})
+        r.raise_for_status()
+    return run
+
+
+def build_workloads(names: list, pdf_pages: list, workdir: str) -> dict:
+    workloads = {}
+    for name in names:
+        if name == "chat":
+            workloads["chat"] = chat_workload()
+        elif name == "tools":
+            for tool_name in TOOLS:
+                workloads[f"tool:{tool_name}"] = tool_workload(tool_name)
+        elif name.startswith("tool:"):
+            workloads[name] = tool_workload(name.split(":", 1)[1])
+        elif name == "upload":
+            for pages in pdf_pages:
+                path = os.path.join(workdir, f"bench-{pages}p.pdf")
+                make_pdf(path, pages)
+                with open(path, "rb") as f:
+                    workloads[f"upload:{pages}p"] = upload_workload(f.read(), pages)
+        elif name == "notes":
+            for note_name in NOTE_WORKLOADS:
+                workloads[note_name] = note_workload(note_name)
+        else:
+            raise SystemExit(f"Unknown workload: {name}")
+    return workloads
+
+
+# ---- measurement -------------------------------------------------------------
+
+def percentile(sorted_values: list, p: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+async def run_level(client, workload, concurrency: int, total: int) -> dict:
+    latencies, errors = [], []
+    next_index = 0
+
+    async def worker(worker_id):
+        nonlocal next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                await workload(client, i, worker_id)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "seconds": round(wall, 3),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ms, 50), 2),
+            "p95": round(percentile(ms, 95), 2),
+            "p99": round(percentile(ms, 99), 2),
+            "mean": round(sum(ms) / len(ms), 2) if ms else 0.0,
+            "max": round(ms[-1], 2) if ms else 0.0,
+        },
+    }
+
+
+# ---- processes ---------------------------------------------------------------
+
+def start_process(args: list, cwd: str, env: dict, log_path: str):
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url: str, process, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ---- reporting ---------------------------------------------------------------
+
+HEADER = f"{'workload':<22} {'conc':>4} {'req':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+
+
+def format_row(r: dict) -> str:
+    lat = r["latency_ms"]
+    return (f"{r['workload']:<22} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.2f} "
+            f"{lat['p50']:>9.1f} {lat['p95']:>9.1f} {lat['p99']:>9.1f}")
+
+
+def print_comparison(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["workload"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline_path}):")
+    print(f"{'workload':<22} {'conc':>4} {'rps':>16} {'p95 ms':>20}")
+    for r in results:
+        before = old.get((r["workload"], r["concurrency"]))
+        if before is None:
+            continue
+
+        def change(new, prev):
+            return f"{(new - prev) / prev * 100:+6.1f}%" if prev else "    n/a"
+
+        print(f"{r['workload']:<22} {r['concurrency']:>4} {r['rps']:>8.2f} {change(r['rps'], before['rps'])} "
+              f"{r['latency_ms']['p95']:>11.1f} {change(r['latency_ms']['p95'], before['latency_ms']['p95'])}")
+
+
+# ---- main --------------------------------------------------------------------
+
+async def run_all(base_url: str, workloads: dict, levels: list, requests: int, timeout: float) -> list:
+    results = []
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for name, workload in workloads.items():
+            for concurrency in levels:
+                result = {"workload": name, **await run_level(client, workload, concurrency, requests)}
+                results.append(result)
+                print(format_row(result), flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against local LLM/search stand-ins")
+    parser.add_argument("--workloads", default="chat,tools,upload,notes",
+                        help="comma-separated: chat, tools, tool:<name>, upload, notes")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per workload and level")
+    parser.add_argument("--pdf-pages", default="1,10,50", help="page counts of the generated upload PDFs")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=400)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--search-latency", type=float, default=0.4)
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300, help="per-request client timeout, seconds")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    pdf_pages = [int(p) for p in args.pdf_pages.split(",")]
+    commit = git_commit()
+
+    with tempfile.TemporaryDirectory(prefix="synthesistalk-bench-") as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+            "NGU_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+            "NGU_API_KEY": "benchmark",
+            "NGU_MODEL": "fake",
+            "SEARCH_PROVIDER": "benchmarks.fake_search:FakeSearchProvider",
+            "FAKE_SEARCH_LATENCY": str(args.search_latency),
+        }
+        llm = start_process(
+            [sys.executable, "-m", "benchmarks.fake_llm", "--port", str(args.llm_port), "--latency",
+             str(args.llm_latency), "--token-rate", str(args.token_rate), "--tokens", str(args.tokens)],
+            BACKEND_DIR, env, os.path.join(workdir, "fake_llm.log"))
+        app = start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"],
+            workdir, env, os.path.join(workdir, "app.log"))
+        try:
+            wait_ready(f"http://127.0.0.1:{args.llm_port}/docs", llm)
+            wait_ready(f"http://127.0.0.1:{args.app_port}/", app)
+            workloads = build_workloads(args.workloads.split(","), pdf_pages, workdir)
+            print(HEADER)
+            results = asyncio.run(run_all(f"http://127.0.0.1:{args.app_port}", workloads, levels,
+                                          args.requests, args.timeout))
+        finally:
+            for process in (app, llm):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# storage_stress.py - concurrent writers against the history and note stores
+
+"""
+Checks that no history message or note is lost or duplicated when many
+threads in several processes write at once, the way uvicorn workers and
+their thread pools do:
+
+    cd backend && python -m benchmarks.storage_stress [--processes 4] [--threads 16] [--ops 500]
+
+For each history backend (--backends, default sqlite,jsonl), --processes
+worker processes each run --ops add_message and save_note calls on
+--threads threads, spread over a few shared users. The write-behind cache
+and JSONL compaction run as in the app. A fresh process then reads
+everything back and every written record must be present exactly once.
+Exits non-zero on any lost or duplicated record.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+HISTORY_USERS = 7
+NOTE_USERS = 5
+
+
+def _setup(workdir: str, backend: str):
+    # Before importing services: their settings are read at import time
+    os.chdir(workdir)
+    os.environ.update(HISTORY_BACKEND=backend, HISTORY_COMPACT_INTERVAL="0.2")
+
+
+def _write(workdir: str, backend: str, worker: int, threads: int, ops: int):
+    _setup(workdir, backend)
+    from services import history_manager, note_manager
+
+    if history_manager.cache:
+        history_manager.cache.start()
+
+    def one(i):
+        history_manager.add_message(f"user-{i % HISTORY_USERS}", f"w{worker}-m{i}", "user")
+        note_manager.save_note(f"user-{i % NOTE_USERS}", f"w{worker}-n{i}")
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(ops)))
+    history_manager.shutdown()
+
+
+def _read(workdir: str, backend: str):
+    _setup(workdir, backend)
+    from services import history_manager, note_manager
+
+    messages = [m.content for u in range(HISTORY_USERS) for m in history_manager.get_history(f"user-{u}")]
+    notes = [n for u in range(NOTE_USERS) for n in note_manager.get_notes(f"user-{u}")["notes"]]
+    return messages, notes
+
+
+def _check(kind: str, found: list, expected: set) -> list:
+    counts = Counter(found)
+    problems = []
+    lost = expected - counts.keys()
+    duplicated = [record for record, count in counts.items() if count > 1]
+    unexpected = counts.keys() - expected
+    if lost:
+        problems.append(f"{kind}: {len(lost)} lost (e.g. {sorted(lost)[:3]})")
+    if duplicated:
+        problems.append(f"{kind}: {len(duplicated)} duplicated (e.g. {sorted(duplicated)[:3]})")
+    if unexpected:
+        problems.append(f"{kind}: {len(unexpected)} unexpected (e.g. {sorted(unexpected)[:3]})")
+    return problems
+
+
+def run(backend: str, processes: int, threads: int, ops: int) -> list:
+    """
+    One stress round on a fresh data directory; returns the problems found
+    """
+    # spawn, so every worker imports the services with this round's settings
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="synthesistalk-stress-") as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        started = time.perf_counter()
+        with ProcessPoolExecutor(processes, mp_context=context) as pool:
+            for future in [pool.submit(_write, workdir, backend, w, threads, ops) for w in range(processes)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            messages, notes = pool.submit(_read, workdir, backend).result()
+
+    writes = processes * ops
+    print(f"{backend:<7} {writes} messages + {writes} notes in {elapsed:.2f}s "
+          f"({2 * writes / elapsed:.0f} writes/s); read back {len(messages)} messages, {len(notes)} notes")
+    return (
+        _check("messages", messages, {f"w{w}-m{i}" for w in range(processes) for i in range(ops)})
+        + _check("notes", notes, {f"w{w}-n{i}" for w in range(processes) for i in range(ops)})
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent add_message/save_note stress test")
+    parser.add_argument("--backends", default="sqlite,jsonl", help="comma-separated HISTORY_BACKEND values")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16, help="threads per process")
+    parser.add_argument("--ops", type=int, default=500, help="messages and notes written per process")
+    args = parser.parse_args()
+
+    failed = False
+    for backend in args.backends.split(","):
+        problems = run(backend, args.processes, args.threads, args.ops)
+        for problem in problems:
+            print(f"  FAIL {backend} {problem}")
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+    print("ok: no lost or duplicated records")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,30 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from routers import chat, tools
+from services import history_manager, llm_client, document_parser, ingestion, export, metrics
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware #for connection with frontend 
 import os
+import time
 
 
-app = FastAPI(title="SynthesisTalk Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    history_manager.start()
+    ingestion.queue.start()
+    export.queue.start()
+    export.enforce_retention()
+    yield
+    await ingestion.queue.stop()
+    await export.queue.stop()
+    # Write out any history still queued in the write-behind cache
+    history_manager.shutdown()
+    await llm_client.close()
+    document_parser.shutdown()
+
+
+app = FastAPI(title="SynthesisTalk Backend", lifespan=lifespan)
 if not os.path.exists("exports"):
     os.makedirs("exports")
 
@@ -17,6 +36,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if metrics.METRICS_ENABLED:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        # Label by endpoint name (upload_status), not the raw path with ids in it
+        route = request.scope.get("route")
+        metrics.observe("http_request_seconds", time.perf_counter() - start,
+                        method=request.method, handler=getattr(route, "name", "unmatched"),
+                        status=response.status_code)
+        return response
+
 app.mount("/exports", StaticFiles(directory="exports"), name="exports")
 
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
@@ -26,3 +57,9 @@ app.include_router(tools.router, prefix="/tools", tags=["Tools"])
 def root():
     return {"message": "SynthesisTalk backend is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text format: stage latencies, LLM token counts, cache hit rates
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
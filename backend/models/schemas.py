@@ -3,8 +3,19 @@ from pydantic import BaseModel
 class ChatRequest(BaseModel):
     user_id: str
     message: str
+    since: str | None = None  # history cursor; the reply then includes every message after it
 
 class ToolRequest(BaseModel):
     tool_name: str
     input_text: str
     user_id: str | None = None
+
+class BatchTool(BaseModel):
+    tool_name: str
+    input_text: str | None = None  # defaults to the batch's input_text
+    timeout: float | None = None   # seconds; defaults to BATCH_TOOL_TIMEOUT
+
+class BatchRequest(BaseModel):
+    tools: list[BatchTool]
+    input_text: str = ""
+    user_id: str | None = None
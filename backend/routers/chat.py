@@ -1,6 +1,8 @@
+import asyncio
 from fastapi import APIRouter
 from models.schemas import ChatRequest
-from services import reasoning, history_manager
+from services import reasoning, history_manager, llm_scheduler
+from services.sse import sse_response
 from services.context_manager import ContextManager
 
 router = APIRouter()
@@ -8,24 +10,90 @@ router = APIRouter()
 # Initialize context manager
 context_mgr = ContextManager()
 
+# History and context reads/writes hit the store, so the async endpoints
+# run them in a worker thread (asyncio.to_thread) off the event loop
+
+def _start_turn(user_id: str, message: str):
+    """
+    Save the user message and build the LLM context for the reply
+    """
+    user_message = history_manager.add_message(user_id, message, "user")
+    full_history = history_manager.get_history(user_id)
+    return user_message, context_mgr.prepare_context_for_llm(full_history[:-1], message, user_id=user_id)
+
+def _save_reply(user_id: str, reply: str):
+    """
+    Save the assistant reply; returns it with the cursor after it
+    """
+    reply_message = history_manager.add_message(user_id, reply, "assistant")
+    return reply_message, history_manager.latest_cursor(user_id)
+
 @router.post("/message")
-def chat_endpoint(chat: ChatRequest):
+async def chat_endpoint(chat: ChatRequest):
     """
     FIXED: Use consistent context management for regular chat
     """
-    # Add user message to history
-    history_manager.add_message(chat.user_id, chat.message)
-    
-    # Get full history
-    full_history = history_manager.get_history(chat.user_id)
-    
-    # Prepare context messages for LLM
-    context_messages = context_mgr.prepare_context_for_llm(full_history[:-1], chat.message)
+    llm_scheduler.set_user(chat.user_id)
+
+    # Add user message to history and prepare context messages for LLM
+    user_message, context_messages = await asyncio.to_thread(_start_turn, chat.user_id, chat.message)
     
     # Get response with proper context
-    reply = reasoning.respond_with_context(context_messages)
+    reply = await reasoning.respond_with_context(context_messages)
     
     # Add assistant's reply to history
-    history_manager.add_message(chat.user_id, reply)
-    
-    return {"reply": reply, "history": history_manager.get_history(chat.user_id)}
\ No newline at end of file
+    reply_message, cursor = await asyncio.to_thread(_save_reply, chat.user_id, reply)
+
+    # Only what the client does not have yet, plus a cursor for the next call
+    if chat.since is not None:
+        page = await asyncio.to_thread(history_manager.get_page, chat.user_id, since=chat.since)
+        return {"reply": reply, **page}
+    return {
+        "reply": reply,
+        "messages": [user_message.to_dict(), reply_message.to_dict()],
+        "cursor": cursor,
+    }
+
+@router.get("/history")
+async def chat_history(user_id: str, since: str = None, before: int = None,
+                       limit: int = history_manager.HISTORY_PAGE_SIZE):
+    """
+    Paged history: ?since=<cursor> for new messages, ?before=<position> for
+    older ones, neither for the latest page (see history_manager.get_page)
+    """
+    return await asyncio.to_thread(history_manager.get_page, user_id, since=since, before=before, limit=limit)
+
+@router.post("/stream")
+async def chat_stream(chat: ChatRequest):
+    """
+    Same as /message, but relays the reply over Server-Sent Events as it is
+    generated: {"type": "delta"} events, then {"type": "done", "reply": ...}
+    """
+    llm_scheduler.set_user(chat.user_id)
+    _, context_messages = await asyncio.to_thread(_start_turn, chat.user_id, chat.message)
+
+    async def events():
+        parts = []
+        saved = False
+        try:
+            async for delta in reasoning.stream_llm_with_messages(context_messages):
+                parts.append(delta)
+                yield {"type": "delta", "content": delta}
+            # Saved before "done", so a history sync right after sees it.
+            # Flagged first: the write finishes in its thread even if the
+            # stream is cancelled while awaiting it
+            saved = True
+            _, cursor = await asyncio.to_thread(_save_reply, chat.user_id,
+                                                "".join(parts) or "Error: response was interrupted.")
+            yield {"type": "done", "reply": "".join(parts), "cursor": cursor}
+        finally:
+            # Persist even if the client disconnects mid-stream, so the
+            # user message always has a reply after it. Handed to a thread
+            # without awaiting: the generator may be closing because its
+            # task was cancelled
+            if not saved:
+                asyncio.get_running_loop().run_in_executor(
+                    None, history_manager.add_message, chat.user_id,
+                    "".join(parts) or "Error: response was interrupted.", "assistant")
+
+    return sse_response(events())
\ No newline at end of file
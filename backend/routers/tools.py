@@ -1,51 +1,181 @@
 # tools.py - FIXED VERSION (Key sections)
 from pathlib import Path
 from fastapi import APIRouter, Form, UploadFile, File, Request
-from models.schemas import ToolRequest
-from services import tool_manager, note_manager, document_parser, reasoning, history_manager
+from fastapi.responses import JSONResponse
+from models.schemas import ToolRequest, BatchRequest
+from services import tool_manager, note_manager, reasoning, history_manager, ingestion, document_index, export, artifacts, llm_scheduler
+from services.jobs import QueueFull
 from services.context_manager import ContextManager
+from services.sse import sse_response
+import asyncio
 import os
+import tempfile
+import time
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # uploads are copied to disk 1 MB at a time
+
+# /batch limits: tools per request, default and maximum per-tool timeout (seconds)
+BATCH_MAX_TOOLS = int(os.getenv("BATCH_MAX_TOOLS", "8"))
+BATCH_TOOL_TIMEOUT = float(os.getenv("BATCH_TOOL_TIMEOUT", "60"))
+BATCH_MAX_TIMEOUT = float(os.getenv("BATCH_MAX_TIMEOUT", "300"))
+
 # Initialize context manager
 context_mgr = ContextManager()
 
+# History and context reads/writes hit the store, so the async endpoints
+# run them in a worker thread (asyncio.to_thread) off the event loop
+
+def _tool_context(user_id, input_text: str, tool_name: str, history=None):
+    """
+    History (loaded unless given), tool-specific input and LLM context
+    messages for one tool call
+    """
+    if history is None:
+        history = history_manager.get_history(user_id) if user_id else []
+    formatted_input = context_mgr.format_tool_input(history, input_text, tool_name, user_id)
+    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, tool_name, user_id)
+    return history, formatted_input, context_messages
+
+def _save_tool_result(tool: ToolRequest, result):
+    """
+    Save the user's original input (not the formatted version) and a
+    readable version of the tool result to history
+    """
+    history_manager.add_message(tool.user_id, tool.input_text, "user", tool.tool_name)
+   
+    # Save assistant's response
+    if isinstance(result, str):
+        history_manager.add_message(tool.user_id, result, "assistant", tool.tool_name)
+    elif isinstance(result, dict):
+        # For structured results, save a readable version
+        if "result" in result:
+            history_manager.add_message(tool.user_id, str(result["result"]), "assistant", tool.tool_name)
+        elif tool.tool_name == "visualize":  # Special case for visualization
+            history_manager.add_message(tool.user_id, "Generated visualization chart from research data", "assistant", tool.tool_name)
+        else:
+            history_manager.add_message(tool.user_id, f"Completed {tool.tool_name} operation", "assistant", tool.tool_name)
+    elif tool.tool_name == "search" and isinstance(result, list):
+        # Search results: titles and links
+        lines = [f"- {item.get('title', '')} ({item.get('href', '')})" for item in result if isinstance(item, dict)]
+        history_manager.add_message(tool.user_id, "Search results:\n" + "\n".join(lines), "assistant", tool.tool_name)
+    elif tool.tool_name == "visualize":
+        history_manager.add_message(tool.user_id, "Generated visualization chart from research data", "assistant", tool.tool_name)
+    else:
+        history_manager.add_message(tool.user_id, f"Completed {tool.tool_name} operation", "assistant", tool.tool_name)
+
 @router.post("/use")
-def use_tool(tool: ToolRequest):
+async def use_tool(tool: ToolRequest):
     """
     FIXED: Enhanced context management for all tools, especially search
     """
-    # Get conversation history
-    history = history_manager.get_history(tool.user_id) if tool.user_id else []
-   
-    # Format input appropriately for each tool
-    formatted_input = context_mgr.format_tool_input(history, tool.input_text, tool.tool_name)
-   
-    # Prepare context messages for LLM calls
-    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, tool.tool_name)
+    llm_scheduler.set_user(tool.user_id)
+
+    # Get conversation history, format input appropriately for each tool
+    # and prepare context messages for LLM calls
+    history, formatted_input, context_messages = await asyncio.to_thread(
+        _tool_context, tool.user_id, tool.input_text, tool.tool_name)
    
     # FIXED: Pass history to tool manager for context-aware execution
-    result = tool_manager.run_tool_with_context(tool.tool_name, formatted_input, context_messages, history)
+    result = await tool_manager.run_tool_with_context(tool.tool_name, formatted_input, context_messages, history, tool.user_id)
     
     # Save to history consistently
     if tool.user_id:
-        # Save user's original input (not the formatted version)
-        history_manager.add_message(tool.user_id, tool.input_text)
-       
-        # Save assistant's response
-        if isinstance(result, str):
-            history_manager.add_message(tool.user_id, result)
-        elif isinstance(result, dict):
-            # For structured results, save a readable version
-            if "result" in result:
-                history_manager.add_message(tool.user_id, str(result["result"]))
-            elif tool.tool_name == "visualize":  # Special case for visualization
-                history_manager.add_message(tool.user_id, "Generated visualization chart from research data")
-            else:
-                history_manager.add_message(tool.user_id, f"Completed {tool.tool_name} operation")
+        await asyncio.to_thread(_save_tool_result, tool, result)
 
     return {"result": result}
 
+@router.post("/batch")
+async def batch_tools(batch: BatchRequest):
+    """
+    Run several tools on the same conversation in one request. History is
+    loaded once and the tools run concurrently; each has its own timeout,
+    and a tool that fails or times out does not affect the others.
+    Results are returned in request order and are not saved to history.
+    """
+    if not batch.tools:
+        return JSONResponse(status_code=400, content={"error": "No tools requested"})
+    if len(batch.tools) > BATCH_MAX_TOOLS:
+        return JSONResponse(status_code=400, content={"error": f"At most {BATCH_MAX_TOOLS} tools per batch"})
+
+    llm_scheduler.set_user(batch.user_id)
+    history = await asyncio.to_thread(history_manager.get_history, batch.user_id) if batch.user_id else []
+
+    async def run(spec):
+        input_text = spec.input_text if spec.input_text is not None else batch.input_text
+        timeout = min(spec.timeout or BATCH_TOOL_TIMEOUT, BATCH_MAX_TIMEOUT)
+        started = time.perf_counter()
+        entry = {"tool_name": spec.tool_name}
+        try:
+            _, formatted_input, context_messages = await asyncio.to_thread(
+                _tool_context, batch.user_id, input_text, spec.tool_name, history)
+            result = await asyncio.wait_for(
+                tool_manager.run_tool_with_context(spec.tool_name, formatted_input, context_messages, history, batch.user_id),
+                timeout,
+            )
+            if isinstance(result, dict) and "error" in result:
+                entry.update(status="error", error=result["error"])
+            else:
+                entry.update(status="ok", result=result)
+        except asyncio.TimeoutError:
+            entry.update(status="timeout", error=f"Timed out after {timeout:g}s")
+        except Exception as e:
+            print(f"⚠️ Batch tool {spec.tool_name} failed:", e)
+            entry.update(status="error", error=str(e))
+        entry["elapsed"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    return {"results": await asyncio.gather(*(run(spec) for spec in batch.tools))}
+
+@router.post("/stream")
+async def stream_tool(tool: ToolRequest):
+    """
+    Streaming variant of /use for summarize, clarify and qa (Server-Sent Events)
+    """
+    if tool.tool_name not in tool_manager.STREAMING_TOOLS:
+        return {"error": f"Streaming is supported for: {', '.join(sorted(tool_manager.STREAMING_TOOLS))}"}
+
+    llm_scheduler.set_user(tool.user_id)
+    history, formatted_input, context_messages = await asyncio.to_thread(
+        _tool_context, tool.user_id, tool.input_text, tool.tool_name)
+
+    def save(reply):
+        """
+        Save the exchange; returns the cursor after it (run in a thread)
+        """
+        if not tool.user_id:
+            return None
+        history_manager.add_message(tool.user_id, tool.input_text, "user", tool.tool_name)
+        history_manager.add_message(tool.user_id, reply or "Error: response was interrupted.", "assistant", tool.tool_name)
+        return history_manager.latest_cursor(tool.user_id)
+
+    async def events():
+        reply = ""
+        saved = False
+        try:
+            async for event in tool_manager.stream_tool_with_context(tool.tool_name, formatted_input, context_messages, history):
+                if event["type"] == "replace":
+                    reply = event["content"]
+                else:
+                    reply += event["content"]
+                yield event
+            # Saved before "done", so a history sync right after sees it.
+            # Flagged first: the write finishes in its thread even if the
+            # stream is cancelled while awaiting it
+            saved = True
+            cursor = await asyncio.to_thread(save, reply)
+            done = {"type": "done", "reply": reply}
+            if tool.user_id:
+                done["cursor"] = cursor
+            yield done
+        finally:
+            # Not awaited: the generator may be closing because its task
+            # was cancelled
+            if not saved:
+                asyncio.get_running_loop().run_in_executor(None, save, reply)
+
+    return sse_response(events())
+
 @router.post("/upload")
 async def upload_document(file: UploadFile = File(...), user_id: str = Form(...)):
     """
@@ -62,53 +192,54 @@ async def upload_document(file: UploadFile = File(...), user_id: str = Form(...)
             "filename": file.filename
         }
     
-    # Save uploaded file
-    file_path = f"temp_{file.filename}"
+    # Save uploaded file, streaming it to disk in chunks instead of
+    # buffering the whole upload in memory; the content hash is computed
+    # on the way and keys the artifact store
+    fd, file_path = tempfile.mkstemp(prefix="upload_", suffix=file_extension)
     try:
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # Extract text based on file type
-        content = document_parser.extract_text_from_document(file_path, file_extension)
-        
-        # Check if extraction was successful
-        if content.startswith("Error"):
-            return {
-                "error": content,
-                "filename": file.filename
-            }
-        
-        # Generate summary
-        summary = reasoning.chain_of_thought_summary(content[:2000])
-        
-        # Determine file icon based on type
-        file_icon = "📄" if file_extension == '.pdf' else "📝"
-        
-        # Save to conversation history
-        summary_message = f"{file_icon} Uploaded **{file.filename}**\n\n📝 Summary:\n{summary}"
-        history_manager.add_message(user_id, summary_message)
-        
-        # Clean up temp file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        return {
-            "filename": file.filename,
-            "file_type": file_extension,
-            "extracted_content": content[:500] + "..." if len(content) > 500 else content,
-            "summary": summary,
-            "success": True
-        }
-        
+        digest = artifacts.new_hasher()
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+
+        # Extraction and summarization run in the background; the client
+        # polls /tools/upload/{job_id}
+        job = await ingestion.queue.submit(ingestion.ingest_document, file_path, file.filename, file_extension,
+                                           user_id, digest.hexdigest())
+
     except Exception as e:
         # Clean up temp file on error
         if os.path.exists(file_path):
             os.remove(file_path)
-        
-        return {
+
+        status_code = 429 if isinstance(e, QueueFull) else 500
+        return JSONResponse(status_code=status_code, content={
             "error": f"Failed to process {file.filename}: {str(e)}",
             "filename": file.filename
-        }
+        })
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": file.filename
+    })
+
+@router.get("/upload/{job_id}")
+async def upload_status(job_id: str):
+    """
+    Poll an upload: status, progress and, once done, the summary result
+    """
+    job = await ingestion.queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"]
+    }
     
 
 @router.post("/note/save")
@@ -128,66 +259,86 @@ def clear_notes(user_id: str = Form(...)):
     return note_manager.clear_notes(user_id)
 
 @router.post("/visualize")
-def visualize_tool(tool: ToolRequest):
-    # Get conversation history
-    history = history_manager.get_history(tool.user_id) if tool.user_id else []
-    
-    # Format input appropriately for visualization
-    formatted_input = context_mgr.format_tool_input(history, tool.input_text, "visualize")
-    
-    # Prepare context messages
-    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, "visualize")
+async def visualize_tool(tool: ToolRequest):
+    llm_scheduler.set_user(tool.user_id)
+
+    # Get conversation history, format input and prepare context messages
+    _, formatted_input, context_messages = await asyncio.to_thread(
+        _tool_context, tool.user_id, tool.input_text, "visualize")
     
     # Run tool with context
-    result = tool_manager.run_tool_with_context("visualize", formatted_input, context_messages)
+    result = await tool_manager.run_tool_with_context("visualize", formatted_input, context_messages)
     
     return {"chart_data": result}
 
 @router.post("/react_agent")
-def use_react_agent(tool: ToolRequest):
-    # Get conversation history
-    history = history_manager.get_history(tool.user_id) if tool.user_id else []
-    
-    # Format input
-    formatted_input = context_mgr.format_tool_input(history, tool.input_text, "react_agent")
-    
-    # Prepare context messages
-    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, "react_agent")
+async def use_react_agent(tool: ToolRequest):
+    llm_scheduler.set_user(tool.user_id)
+
+    # Get conversation history, format input and prepare context messages
+    _, formatted_input, context_messages = await asyncio.to_thread(
+        _tool_context, tool.user_id, tool.input_text, "react_agent")
     
     # Run tool with context
-    result = tool_manager.run_tool_with_context("react_agent", formatted_input, context_messages)
+    result = await tool_manager.run_tool_with_context("react_agent", formatted_input, context_messages)
     
     return {"result": result}
 
 @router.post("/export")
-def export_as_pdf(tool: ToolRequest):
-    # Get conversation history
-    history = history_manager.get_history(tool.user_id) if tool.user_id else []
-    
-    # Format input
-    formatted_input = context_mgr.format_tool_input(history, tool.input_text, "export_pdf")
-    
-    # Prepare context messages
-    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, "export_pdf")
-    
-    # Run tool with context
-    result = tool_manager.run_tool_with_context("export_pdf", formatted_input, context_messages)
-    
-    return {"result": result}
+async def export_as_pdf(tool: ToolRequest):
+    """
+    Export input_text, or the whole conversation when input_text is empty.
+    An identical earlier export is returned at once ({"result": ...});
+    otherwise the PDF is rendered in the background and the response is
+    202 with a job_id to poll at /tools/export/{job_id}.
+    """
+    try:
+        if tool.input_text.strip() or not tool.user_id:
+            title = "SynthesisTalk Export"
+            path = export.find_export(export.content_key(title, tool.input_text))
+            if path is None:
+                job = await export.queue.submit(export.export_text, tool.input_text, title)
+        else:
+            title = "SynthesisTalk Conversation"
+            # Reads the whole history, so off the event loop
+            key, count = await asyncio.to_thread(export.conversation_key, title,
+                                                 history_manager.iter_messages(tool.user_id))
+            path = export.find_export(key)
+            if path is None:
+                job = await export.queue.submit(export.export_conversation, tool.user_id, key, count, title)
+    except QueueFull as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
+
+    if path is not None:
+        return {"result": {"file_path": path}}
+    return JSONResponse(status_code=202, content={"job_id": job["id"], "status": job["status"]})
+
+@router.get("/export/{job_id}")
+async def export_status(job_id: str):
+    """
+    Poll an export job; result holds file_path once it is done
+    """
+    job = await export.queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"]
+    }
 
 @router.post("/qa")
-def qa_tool(tool: ToolRequest):
-    # Get conversation history
-    history = history_manager.get_history(tool.user_id) if tool.user_id else []
-    
-    # Format input
-    formatted_input = context_mgr.format_tool_input(history, tool.input_text, "qa")
-    
-    # Prepare context messages
-    context_messages = context_mgr.prepare_context_for_llm(history, formatted_input, "qa")
+async def qa_tool(tool: ToolRequest):
+    llm_scheduler.set_user(tool.user_id)
+
+    # Get conversation history, format input and prepare context messages
+    _, formatted_input, context_messages = await asyncio.to_thread(
+        _tool_context, tool.user_id, tool.input_text, "qa")
     
     # Run tool with context
-    result = tool_manager.run_tool_with_context("qa", formatted_input, context_messages)
+    result = await tool_manager.run_tool_with_context("qa", formatted_input, context_messages)
     
     return {"result": result}
 
@@ -198,52 +349,21 @@ async def reset_conversation(request: Request):
     if not user_id:
         return {"error": "Missing user_id"}
 
-    history_manager.clear_history(user_id)
+    await asyncio.to_thread(history_manager.clear_history, user_id)
+    await asyncio.to_thread(document_index.clear, user_id)
     return {"status": "conversation reset"}
 
 # Add this to your tools.py file
 
 @router.post("/generate_topic")
-def generate_topic_title(request: dict):
+async def generate_topic_title(request: dict):
     """
     Generate a conversation topic title without saving to history
     """
+    llm_scheduler.set_user(request.get("user_id"))
     conversation_text = request.get("conversation_text", "")
     
     if not conversation_text:
         return {"topic": "New Conversation"}
     
-    # Create a focused prompt for topic generation
-    messages = [
-        {
-            "role": "system", 
-            "content": (
-                "You are a topic summarizer. Generate a concise 3-5 word title "
-                "that captures the main research topic or question being discussed. "
-                "Return only the title, no quotes, no extra text."
-            )
-        },
-        {
-            "role": "user", 
-            "content": f"Generate a topic title for this conversation:\n\n{conversation_text}"
-        }
-    ]
-    
-    try:
-        response = reasoning.call_llm_with_messages(messages)
-        
-        # Clean up the response
-        topic = response.strip()
-        topic = topic.replace('"', '').replace("'", "")
-        topic = topic.replace("Title:", "").strip()
-        
-        # Ensure it's not too long
-        if len(topic) > 50:
-            words = topic.split()[:4]  # Take first 4 words
-            topic = " ".join(words)
-        
-        return {"topic": topic if topic else "Research Discussion"}
-        
-    except Exception as e:
-        print(f"Topic generation error: {e}")
-        return {"topic": "Research Discussion"}
\ No newline at end of file
+    return {"topic": await reasoning.generate_topic_title(conversation_text)}
\ No newline at end of file
@@ -0,0 +1,132 @@
+# artifacts.py - content-addressed store of document parse results
+
+"""
+Uploads are identified by the SHA-256 of their bytes. For each one this
+store keeps the extracted text, the character offset where each page
+starts, and the summaries generated for it, so uploading the same file
+again (by any user) skips pdfplumber and the summary LLM calls.
+
+Layout: ARTIFACT_DIR/<sha[:2]>/<sha>/text.txt and meta.json. Files are
+written atomically, so concurrent workers storing the same document are
+harmless. The store is kept under ARTIFACT_MAX_BYTES; least recently used
+documents are evicted first.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from services.storage import atomic_write_json, read_json, update_json
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("data", "artifacts"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_evict_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def _dir(sha: str) -> str:
+    return os.path.join(ARTIFACT_DIR, sha[:2], sha)
+
+
+def _meta_path(sha: str) -> str:
+    return os.path.join(_dir(sha), "meta.json")
+
+
+def get(sha: str) -> dict | None:
+    """
+    Metadata of a stored document (file_type, page_offsets, chars,
+    summaries), or None; marks it as recently used
+    """
+    global hits, misses
+    path = _meta_path(sha)
+    meta, _ = read_json(path)
+    if not meta or not os.path.exists(os.path.join(_dir(sha), "text.txt")):
+        misses += 1
+        return None
+    hits += 1
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return meta
+
+
+def load_text(sha: str) -> str:
+    with open(os.path.join(_dir(sha), "text.txt"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def put_text(sha: str, text: str, file_type: str, page_offsets: list):
+    directory = _dir(sha)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f"text.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, os.path.join(directory, "text.txt"))
+    atomic_write_json(_meta_path(sha), {
+        "sha256": sha,
+        "file_type": file_type,
+        "chars": len(text),
+        "page_offsets": page_offsets,
+        "summaries": {},
+        "created_at": time.time(),
+    })
+    evict()
+
+
+def put_summary(sha: str, summary: str, format: str = "text"):
+    path = _meta_path(sha)
+    if not os.path.exists(path):
+        return  # evicted meanwhile
+
+    def mutate(meta):
+        meta.setdefault("summaries", {})[format] = summary
+
+    update_json(path, mutate)
+
+
+def _size(directory: str) -> int:
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def evict():
+    """
+    Drop least recently used documents until the store fits ARTIFACT_MAX_BYTES
+    """
+    if not os.path.isdir(ARTIFACT_DIR):
+        return
+    with _evict_lock:
+        entries = []
+        for shard in os.scandir(ARTIFACT_DIR):
+            if not shard.is_dir():
+                continue
+            for doc in os.scandir(shard.path):
+                if not doc.is_dir():
+                    continue
+                meta = os.path.join(doc.path, "meta.json")
+                used = os.path.getmtime(meta) if os.path.exists(meta) else 0
+                entries.append((used, _size(doc.path), doc.path))
+
+        entries.sort()  # least recently used first
+        total = sum(size for _, size, _ in entries)
+        while entries and total > ARTIFACT_MAX_BYTES:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def stats() -> dict:
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
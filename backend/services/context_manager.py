@@ -2,13 +2,33 @@
 
 from typing import List, Dict, Any
 import json
-import re
+import os
+from services import document_index, metrics, rolling_summary
+from services.messages import Message
+from services.text_analysis import analyze
+from services.tokens import cached_count_tokens, truncate_to_tokens
+
+# Prompt budget for system message + history + current input
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# How far back history messages are considered for the prompt
+CONTEXT_LOOKBACK = int(os.getenv("CONTEXT_LOOKBACK", "50"))
+
+# Cap for the rolling conversation summary injected into prompts
+SUMMARY_MAX_TOKENS = 250
+
+# Tools whose prompts get excerpts retrieved from the user's uploaded documents
+# (None is plain chat)
+RETRIEVAL_TOOLS = {None, "qa", "clarify", "summarize", "react_agent"}
 
 class ContextManager:
-    def __init__(self, max_context_length: int = 10):
+    def __init__(self, max_context_length: int = 10, token_budget: int = CONTEXT_TOKEN_BUDGET):
         self.max_context_length = max_context_length
+        self.token_budget = token_budget
+        # No single history message may take more than this share of the budget
+        self.max_message_tokens = max(token_budget // 4, 1)
    
-    def prepare_context_for_llm(self, history: List[str], current_input: str, tool_name: str = None) -> List[Dict[str, str]]:
+    @metrics.timed("context_prepare")
+    def prepare_context_for_llm(self, history: List[Message], current_input: str, tool_name: str = None, user_id: str = None) -> List[Dict[str, str]]:
         """
         Prepare consistent context for all LLM calls with smart context selection
         """
@@ -16,20 +36,39 @@ class ContextManager:
        
         # Add system message with tool-specific instructions
         system_content = self._get_system_message(tool_name)
+        if user_id and tool_name in RETRIEVAL_TOOLS:
+            system_content += self._get_document_context(user_id, current_input)
         messages.append({"role": "system", "content": system_content})
-       
+
+        # Long conversations keep a rolling summary; it is only sent when
+        # older turns are actually left out of the prompt below
+        summary = ""
+        if user_id and history:
+            summary = self._get_rolling_summary(user_id, history)
+
         # Smart context selection based on tool
         if tool_name == "search":
             # For search: intelligently select context that maintains topic continuity
             context_history = self._get_smart_search_context(history, current_input)
+            if len(context_history) == len(history):
+                summary = ""
+            selected = [(msg.role, truncate_to_tokens(msg.content, self.max_message_tokens)) for msg in context_history]
         else:
-            # Other tools: use full context (last 10 messages)
-            context_history = history[-self.max_context_length:] if len(history) > self.max_context_length else history
-       
-        # Add conversation history
-        for i, msg in enumerate(context_history):
-            role = "user" if i % 2 == 0 else "assistant"
-            messages.append({"role": role, "content": msg})
+            # Other tools: pack relevant and recent messages into the token budget
+            available = (self.token_budget
+                         - cached_count_tokens(system_content)
+                         - cached_count_tokens(current_input))
+            chosen = self._select_by_budget(history, current_input, available)
+            if len(chosen) == len(history):
+                summary = ""
+            elif summary:
+                chosen = self._select_by_budget(history, current_input, available - cached_count_tokens(summary))
+            selected = [(history[index].role, text) for index, text in chosen]
+
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        for role, text in selected:
+            messages.append({"role": role, "content": text})
        
         # Add current input
         if current_input.strip():
@@ -37,7 +76,77 @@ class ContextManager:
        
         return messages
 
-    def _get_smart_search_context(self, history: List[str], current_input: str) -> List[str]:
+    def _select_by_budget(self, history: List[Message], current_input: str, available: int) -> List[tuple]:
+        """
+        Pick (index, text) history messages that fit in `available` tokens.
+        The latest exchange always goes in (newest first), cut down to what
+        is left of the budget if it does not fit; only when nothing is left
+        is it dropped. Older messages compete on a mix of recency and word
+        overlap with the current input. Oversized messages are cut down to
+        max_message_tokens. Chronological order is kept in the result.
+        """
+        if not history or available <= 0:
+            return []
+
+        start = max(len(history) - CONTEXT_LOOKBACK, 0)
+        input_terms = self._terms(current_input)
+        last = len(history) - 1
+
+        def score(index):
+            recency = 0.85 ** (last - index)
+            terms = self._terms(history[index].content)
+            overlap = len(input_terms & terms) / len(input_terms | terms) if input_terms and terms else 0.0
+            return recency + overlap
+
+        # Always-included latest exchange first, then the rest by score
+        must = list(range(last, max(last - 1, start) - 1, -1))
+        rest = sorted(range(start, max(last - 1, start)), key=score, reverse=True)
+
+        chosen = {}
+        for index in must + rest:
+            msg = history[index]
+            if msg.tokens <= self.max_message_tokens:
+                text, cost = msg.content, msg.tokens  # counted once, when stored
+            else:
+                text = truncate_to_tokens(msg.content, self.max_message_tokens)
+                cost = cached_count_tokens(text)
+            if cost > available:
+                if index not in must:
+                    continue
+                text, cost = self._fit(msg.content, available)
+                if not text.strip():
+                    continue
+            chosen[index] = text
+            available -= cost
+        return sorted(chosen.items())
+
+    @staticmethod
+    def _fit(text: str, available: int) -> tuple:
+        """
+        `text` cut down to at most `available` tokens, with its cost
+        """
+        target = available
+        while target > 0:
+            cut = truncate_to_tokens(text, target)
+            cost = cached_count_tokens(cut)
+            if cost <= available:
+                return cut, cost
+            target = target * available // cost  # truncation is approximate; aim lower
+        return "", 0
+
+    def _get_rolling_summary(self, user_id: str, history: List[Message]) -> str:
+        if len(history) <= self.max_context_length:
+            return ""
+        summary = rolling_summary.get_state(user_id)["summary"]
+        if not summary:
+            return ""
+        return "Summary of the earlier conversation:\n" + truncate_to_tokens(summary, SUMMARY_MAX_TOKENS)
+
+    @staticmethod
+    def _terms(text: str) -> frozenset:
+        return analyze(text).terms
+
+    def _get_smart_search_context(self, history: List[Message], current_input: str) -> List[Message]:
         """
         Intelligently select context for search tool to maintain topic continuity
         while respecting rate limits
@@ -46,39 +155,43 @@ class ContextManager:
             return history
         
         # Strategy: Include topic-establishing messages + recent context
-        context_messages = []
+        selected = []
         
         # 1. Find the most recent topic-establishing user message (questions, topics)
-        topic_message = None
-        topic_index = -1
-        
-        # Look for substantial user messages that establish topics
-        for i in range(len(history) - 2, -1, -2):  # Go backwards through user messages
-            msg = history[i].strip()
-            if (len(msg.split()) > 3 and 
-                (msg.endswith('?') or 
-                 any(keyword in msg.lower() for keyword in ['about', 'explain', 'what', 'how', 'why', 'tell me']) or
-                 len(msg) > 20)):
-                topic_message = msg
-                topic_index = i
+        for i in range(len(history) - 2, -1, -1):  # Go backwards through user messages
+            if history[i].role == "user" and analyze(history[i].content).establishes_topic:
+                # 2. Include the topic message and its response
+                selected.extend([i, i + 1])
                 break
         
-        # 2. Include the topic message and its response if found
-        if topic_message and topic_index >= 0:
-            context_messages.extend([topic_message])
-            if topic_index + 1 < len(history):
-                context_messages.append(history[topic_index + 1])  # Assistant's response
-        
-        # 3. Add the most recent 2 exchanges (4 messages) for immediate context
-        recent_context = history[-4:] if len(history) >= 4 else history
-        
-        # Avoid duplicating messages
-        for msg in recent_context:
-            if msg not in context_messages:
-                context_messages.append(msg)
+        # 3. Add the most recent 2 exchanges (4 messages) for immediate context,
+        # skipping any already included
+        for i in range(len(history) - 4, len(history)):
+            if i not in selected:
+                selected.append(i)
         
         # Ensure we don't exceed 6 messages total (reasonable for search)
-        return context_messages[-6:]
+        return [history[i] for i in selected][-6:]
+
+    def _get_document_context(self, user_id: str, current_input: str) -> str:
+        """
+        Most relevant excerpts of the user's uploaded documents for this input
+        """
+        try:
+            # One indexed lookup, so users without uploads skip the FTS query
+            if not document_index.has_documents(user_id):
+                return ""
+            excerpts = document_index.search(user_id, current_input)
+        except Exception as e:
+            print("⚠️ Document retrieval failed:", e)
+            return ""
+        if not excerpts:
+            return ""
+        formatted = "\n\n".join(f"[{e['filename']}, part {e['position'] + 1}]\n{e['content']}" for e in excerpts)
+        return (
+            "\n\nRelevant excerpts from the user's uploaded documents "
+            "(use them when they help answer, and cite the document name):\n\n" + formatted
+        )
 
     def _get_system_message(self, tool_name: str) -> str:
         """
@@ -109,16 +222,16 @@ class ContextManager:
        
         return base_prompt
 
-    def format_tool_input(self, history: List[str], user_input: str, tool_name: str) -> str:
+    def format_tool_input(self, history: List[Message], user_input: str, tool_name: str, user_id: str = None) -> str:
         """
         Format input appropriately for each tool with context awareness
         """
         if tool_name == "visualize":
             # For visualize, use the last assistant response if no user input
             if not user_input.strip() and history:
-                for i in range(len(history) - 1, -1, -1):
-                    if i % 2 == 1:  # assistant's message
-                        return history[i]
+                for msg in reversed(history):
+                    if msg.role == "assistant":
+                        return msg.content
             return user_input or "Generate visualization from our discussion"
        
         elif tool_name == "search":
@@ -127,7 +240,7 @@ class ContextManager:
                 # If user provides input, enhance it with context if it's too brief
                 if len(user_input.split()) <= 2 and history:
                     # Find recent topic context
-                    context_topic = self._extract_current_topic(history)
+                    context_topic = self._extract_current_topic(history, user_id)
                     if context_topic:
                         enhanced_query = f"{user_input} {context_topic}"
                         return enhanced_query
@@ -135,7 +248,7 @@ class ContextManager:
             else:
                 # If no input, infer from context
                 if history:
-                    topic = self._extract_current_topic(history)
+                    topic = self._extract_current_topic(history, user_id)
                     if topic:
                         return f"search for more information about {topic}"
                 return "Please provide a search query"
@@ -144,38 +257,47 @@ class ContextManager:
             # For other tools, use input as-is
             return user_input
 
-    def _extract_current_topic(self, history: List[str]) -> str:
+    def _extract_current_topic(self, history: List[Message], user_id: str = None) -> str:
         """
         Extract the current research topic from conversation history
         """
+        if user_id:
+            # Kept up to date incrementally, no rescan
+            return rolling_summary.get_state(user_id)["topic"]
+
         # Look for the most recent substantial user question or topic
-        for i in range(len(history) - 2, -1, -2):  # Go backwards through user messages
-            msg = history[i].strip()
-            if len(msg.split()) > 3:
-                # Extract key terms (remove common words)
-                words = msg.lower().split()
-                filtered_words = [w for w in words if w not in ['what', 'how', 'why', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'can', 'could', 'would', 'should', 'tell', 'me', 'you', 'i', 'we', 'they']]
-                if filtered_words:
-                    return ' '.join(filtered_words[:4])  # Take first 4 meaningful words
+        for i in range(len(history) - 2, -1, -1):  # Go backwards through user messages
+            if history[i].role != "user":
+                continue
+            analysis = analyze(history[i].content)
+            if analysis.word_count > 3 and analysis.topic:
+                return analysis.topic
         
         return ""
 
-    def get_conversation_summary(self, history: List[str]) -> str:
+    def get_conversation_summary(self, history: List[Message], user_id: str = None) -> str:
         """
         Get a brief summary of the conversation for context
         """
         if not history:
             return "No previous conversation"
-        
-        # Find main topics discussed
-        topics = []
-        for i in range(0, len(history), 2):  # User messages
-            if i < len(history):
-                msg = history[i].strip()
-                if len(msg.split()) > 3:
-                    topic = self._extract_key_terms(msg)
-                    if topic:
-                        topics.append(topic)
+
+        if user_id:
+            state = rolling_summary.get_state(user_id)
+            if state["summary"]:
+                return truncate_to_tokens(state["summary"], SUMMARY_MAX_TOKENS)
+            topics = state["topics"]
+        else:
+            # Find main topics discussed
+            topics = []
+            for msg in history:
+                if msg.role != "user":
+                    continue
+                analysis = analyze(msg.content)
+                if analysis.word_count > 3 and analysis.key_terms:
+                    topics.append(analysis.key_terms)
+                    if len(topics) == 3:
+                        break
         
         if topics:
             return f"Discussing: {', '.join(topics[:3])}"
@@ -185,14 +307,4 @@ class ContextManager:
         """
         Extract key terms from a message
         """
-        # Simple keyword extraction
-        important_words = []
-        words = text.lower().split()
-        
-        for word in words:
-            word = re.sub(r'[^a-zA-Z]', '', word)  # Remove punctuation
-            if (len(word) > 3 and 
-                word not in ['what', 'how', 'why', 'when', 'where', 'would', 'could', 'should', 'about', 'explain', 'tell']):
-                important_words.append(word)
-        
-        return ' '.join(important_words[:2]) if important_words else ""
\ No newline at end of file
+        return analyze(text).key_terms
\ No newline at end of file
@@ -0,0 +1,117 @@
+# document_index.py - per-user full-text index of uploaded documents
+
+"""
+Extracted document text is kept as ~DOCUMENT_CHUNK_TOKENS-token chunks in
+an SQLite FTS5 table. ContextManager asks for the top DOCUMENT_TOP_K chunks
+ranked by BM25 for the current input, so follow-up questions are answered
+from the document itself rather than from its summary, while prompts stay
+small. Lookups are a single indexed query and take milliseconds even over
+thousands of chunks.
+
+Documents are keyed by (user_id, sha256) of the uploaded file, so
+uploading the same file again does not index (and return) its chunks twice.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from services.summarizer import chunk_text
+
+DOCUMENT_DB_PATH = os.getenv("DOCUMENT_DB_PATH", "data/documents.db")
+DOCUMENT_CHUNK_TOKENS = int(os.getenv("DOCUMENT_CHUNK_TOKENS", "300"))
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "3"))
+MAX_QUERY_TERMS = 32
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DOCUMENT_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(DOCUMENT_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                "filename TEXT NOT NULL, chunk_count INTEGER NOT NULL, created_at REAL NOT NULL, "
+                "sha256 TEXT)"  # content hash of the upload (artifacts), so re-uploads are indexed once
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_user ON documents (user_id)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_sha ON documents (user_id, sha256)")
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "content, user_id UNINDEXED, document_id UNINDEXED, position UNINDEXED, "
+                "tokenize='porter unicode61')"
+            )
+        _local.conn = conn
+    return conn
+
+
+def _find(user_id: str, sha256: str):
+    row = _conn().execute("SELECT id FROM documents WHERE user_id = ? AND sha256 = ?", (user_id, sha256)).fetchone()
+    return row[0] if row else None
+
+
+def add_document(user_id: str, filename: str, text: str, sha256: str = None) -> int:
+    """
+    Chunk and index a document for a user; returns the document id. A
+    document with the same content hash the user already has is not
+    indexed again (its existing id is returned)
+    """
+    if sha256:
+        existing = _find(user_id, sha256)
+        if existing is not None:
+            return existing
+    chunks = chunk_text(text, DOCUMENT_CHUNK_TOKENS)
+    with _conn() as conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO documents (user_id, filename, chunk_count, created_at, sha256) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, filename, len(chunks), time.time(), sha256),
+        )
+        if not cursor.rowcount:  # indexed concurrently by another upload
+            return _find(user_id, sha256)
+        document_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO chunks (content, user_id, document_id, position) VALUES (?, ?, ?, ?)",
+            [(chunk, user_id, document_id, i) for i, chunk in enumerate(chunks)],
+        )
+    return document_id
+
+
+def _match_expression(query: str) -> str:
+    # Quote every term so user text can never be parsed as FTS5 syntax
+    terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))[:MAX_QUERY_TERMS]
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def search(user_id: str, query: str, k: int = DOCUMENT_TOP_K) -> list:
+    """
+    Top-k chunks of the user's documents for `query`, best first
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    rows = _conn().execute(
+        "SELECT c.content, c.position, d.filename, bm25(chunks) AS score "
+        "FROM chunks c JOIN documents d ON d.id = c.document_id "
+        "WHERE chunks MATCH ? AND c.user_id = ? "
+        "ORDER BY score LIMIT ?",
+        (expression, user_id, k),
+    ).fetchall()
+    return [{"content": r[0], "position": r[1], "filename": r[2], "score": r[3]} for r in rows]
+
+
+def has_documents(user_id: str) -> bool:
+    return _conn().execute("SELECT 1 FROM documents WHERE user_id = ? LIMIT 1", (user_id,)).fetchone() is not None
+
+
+def clear(user_id: str):
+    with _conn() as conn:
+        conn.execute("DELETE FROM chunks WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM documents WHERE user_id = ?", (user_id,))
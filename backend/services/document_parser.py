@@ -1,14 +1,108 @@
 
-#document_parser.py 
+#document_parser.py
+
+"""
+Text extraction for uploaded documents.
+
+PDFs are read page by page through generators (iter_pdf_pages), so callers
+can consume text incrementally and each page's parse state is released as
+soon as its text is out. Large PDFs (PDF_PARALLEL_MIN_PAGES pages or more)
+are split into page ranges that are extracted in a process pool across
+cores, with only a bounded number of ranges in flight at once.
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import docx
 import pdfplumber
 
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
 
-def extract_text_from_pdf(file_path):
+# Workers are not forked from the app process: a fork copies its threads'
+# locks (history flusher, job workers, sqlite connections) in whatever
+# state they are in. forkserver where available, spawn otherwise (Windows)
+PDF_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                        mp_context=multiprocessing.get_context(PDF_START_METHOD))
+    return _executor
+
+
+def shutdown():
+    """
+    Stop the extraction process pool (called from the app lifespan)
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def count_pdf_pages(file_path):
     with pdfplumber.open(file_path) as pdf:
-        text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-    return text
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(file_path, start=0, end=None):
+    """
+    Yield the text of pages [start, end) one at a time
+    """
+    with pdfplumber.open(file_path) as pdf:
+        pages = pdf.pages[start:end]
+        for page in pages:
+            yield page.extract_text() or ""
+            page.close()  # drop cached layout objects for this page
+
+
+def _extract_page_range(args):
+    # Runs in a worker process, so it takes a picklable tuple
+    file_path, start, end = args
+    return list(iter_pdf_pages(file_path, start, end))
+
+
+def iter_pdf_pages_parallel(file_path, workers=PDF_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Yield page texts in order while page ranges are extracted in parallel.
+    At most 2 x workers ranges are queued, which bounds memory on huge files.
+    """
+    total = count_pdf_pages(file_path)
+    ranges = [(file_path, s, min(s + pages_per_task, total)) for s in range(0, total, pages_per_task)]
+    executor = _get_executor()
+
+    in_flight = deque()
+    next_range = 0
+    while next_range < len(ranges) or in_flight:
+        while next_range < len(ranges) and len(in_flight) < 2 * workers:
+            in_flight.append(executor.submit(_extract_page_range, ranges[next_range]))
+            next_range += 1
+        for text in in_flight.popleft().result():
+            yield text
+
+
+def iter_pdf_text(file_path, parallel=None):
+    """
+    Page texts in order; `parallel` defaults to on for large documents
+    """
+    if parallel is None:
+        parallel = PDF_WORKERS > 1 and count_pdf_pages(file_path) >= PDF_PARALLEL_MIN_PAGES
+    if parallel:
+        return iter_pdf_pages_parallel(file_path)
+    return iter_pdf_pages(file_path)
+
+
+def extract_text_from_pdf(file_path):
+    return "\n".join(iter_pdf_text(file_path))
 
 def extract_text_from_docx(file_path):
     """Extract text from Word documents (.docx)"""
@@ -24,10 +118,10 @@ def extract_text_from_document(file_path, file_extension):
     Universal document text extractor
     """
     file_extension = file_extension.lower()
-    
+
     if file_extension == '.pdf':
         return extract_text_from_pdf(file_path)
     elif file_extension in ['.docx', '.doc']:
         return extract_text_from_docx(file_path)
     else:
-        return f"Unsupported file type: {file_extension}"
\ No newline at end of file
+        return f"Unsupported file type: {file_extension}"
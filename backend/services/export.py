@@ -1,36 +1,236 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.utils import simpleSplit
+# export.py - PDF exports of replies and whole conversations
+
+"""
+Exports are content-addressed: the file name is a hash of the title and
+content (for conversations, of the message hashes), so exporting the same
+thing twice returns the existing file instead of rendering it again.
+
+Rendering consumes an iterator of text blocks and draws each wrapped line
+as it comes, so a long conversation is streamed from the history store
+page by page rather than built up in memory first. Conversation exports
+run as background jobs on `queue` (see /tools/export).
+
+The exports directory is kept within EXPORT_MAX_FILES files and
+EXPORT_MAX_BYTES bytes, least recently requested first, and files older
+than EXPORT_MAX_AGE seconds are removed.
+"""
+
+import asyncio
+import hashlib
 import os
-import uuid
+import threading
+import time
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from services import history_manager
+from services.jobs import JobQueue
+
+EXPORT_DIR = "exports"
+EXPORT_MAX_FILES = int(os.getenv("EXPORT_MAX_FILES", "200"))
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+EXPORT_MAX_AGE = float(os.getenv("EXPORT_MAX_AGE", str(7 * 24 * 3600)))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "16"))
+
+FONT = "Helvetica"
+FONT_SIZE = 12
+LINE_HEIGHT = 18
+MARGIN = 72
+
+queue = JobQueue("export", EXPORT_WORKERS, EXPORT_QUEUE_SIZE)
+
+
+def export_path(key: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{key}.pdf")
+
+
+def content_key(title: str, content: str) -> str:
+    return hashlib.sha256(f"{title}\0{content}".encode("utf-8")).hexdigest()[:32]
+
+
+def conversation_key(title: str, messages):
+    """
+    (key, message count) for a conversation export, from the stored
+    message hashes only
+    """
+    digest = hashlib.sha256(f"{title}\0conversation".encode("utf-8"))
+    count = 0
+    for message in messages:
+        digest.update(f"\0{message.role}:{message.hash}".encode("utf-8"))
+        count += 1
+    return digest.hexdigest()[:32], count
+
+
+def find_export(key: str) -> str | None:
+    """
+    Path of an existing export, marked as recently used
+    """
+    path = export_path(key)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    return None
 
-def generate_pdf(content: str, title="SynthesisTalk Export"):
-    filename = f"{uuid.uuid4().hex}.pdf"
-    filepath = os.path.join("exports", filename)
 
-    os.makedirs("exports", exist_ok=True)
+@lru_cache(maxsize=8192)
+def _word_width(word: str) -> float:
+    return stringWidth(word, FONT, FONT_SIZE)
 
-    c = canvas.Canvas(filepath, pagesize=letter)
+
+def wrap_paragraph(paragraph: str, max_width: float):
+    """
+    Yield lines of `paragraph` no wider than max_width; word widths are
+    measured once and cached, words wider than a line are split
+    """
+    if not paragraph:
+        return  # blank lines are not drawn
+    space = _word_width(" ")
+    line, width = [], 0.0
+    for word in paragraph.split(" "):
+        w = _word_width(word)
+        if w > max_width:
+            # Hard-split an overlong word (URLs, hashes)
+            if line:
+                yield " ".join(line)
+                line, width = [], 0.0
+            piece = ""
+            for char in word:
+                if stringWidth(piece + char, FONT, FONT_SIZE) > max_width and piece:
+                    yield piece
+                    piece = ""
+                piece += char
+            word, w = piece, _word_width(piece)
+        if line and width + space + w > max_width:
+            yield " ".join(line)
+            line, width = [], 0.0
+        width = w if not line else width + space + w
+        line.append(word)
+    yield " ".join(line)
+
+
+def render_pdf(path: str, title: str, blocks):
+    """
+    Draw an iterable of (heading, text) blocks; heading may be None.
+    Written to a temporary file and moved into place when complete.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Unique per thread: identical exports may be rendered concurrently
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    c = canvas.Canvas(tmp_path, pagesize=letter)
     width, height = letter
+    max_width = width - 2 * MARGIN  # 1 inch margin left and right
 
     # Header
     c.setFont("Helvetica-Bold", 16)
-    c.drawString(72, height - 72, title)
-
-    c.setFont("Helvetica", 12)
+    c.drawString(MARGIN, height - MARGIN, title)
     y = height - 100
-    max_width = width - 144  # 1 inch margin left and right
-
-    # Split content into lines and wrap them if too long
-    for paragraph in content.split("\n"):
-        lines = simpleSplit(paragraph, "Helvetica", 12, max_width)
-        for line in lines:
-            if y < 72:  # New page if too low
-                c.showPage()
-                c.setFont("Helvetica", 12)
-                y = height - 72
-            c.drawString(72, y, line)
-            y -= 18
+
+    def new_line(font):
+        nonlocal y
+        if y < MARGIN:  # New page if too low
+            c.showPage()
+            y = height - MARGIN
+        c.setFont(font, FONT_SIZE)
+
+    for heading, text in blocks:
+        if heading:
+            new_line("Helvetica-Bold")
+            c.drawString(MARGIN, y, heading)
+            y -= LINE_HEIGHT
+        for paragraph in text.split("\n"):
+            for line in wrap_paragraph(paragraph, max_width):
+                new_line(FONT)
+                c.drawString(MARGIN, y, line)
+                y -= LINE_HEIGHT
+        if heading:
+            y -= LINE_HEIGHT / 2  # gap between messages
 
     c.save()
-    return filepath
\ No newline at end of file
+    os.replace(tmp_path, path)
+
+
+def generate_pdf(content: str, title="SynthesisTalk Export"):
+    key = content_key(title, content)
+    path = find_export(key)
+    if path is None:
+        path = export_path(key)
+        render_pdf(path, title, [(None, content)])
+        enforce_retention()
+    return path
+
+
+def generate_conversation_pdf(key: str, messages, title="SynthesisTalk Conversation"):
+    """
+    Render `messages` (any iterable of messages.Message, e.g. a paged
+    history iterator) to the export for `key`
+    """
+    path = find_export(key)
+    if path is None:
+        path = export_path(key)
+        blocks = (("You" if m.role == "user" else "SynthesisTalk", m.content) for m in messages)
+        render_pdf(path, title, blocks)
+        enforce_retention()
+    return path
+
+
+async def export_text(job, content: str, title: str):
+    """
+    Job: export one piece of text (a reply)
+    """
+    job["progress"]["stage"] = "rendering"
+    path = await asyncio.to_thread(generate_pdf, content, title)
+    return {"file_path": path}
+
+
+async def export_conversation(job, user_id: str, key: str, count: int, title: str):
+    """
+    Job: export the first `count` messages of a user's history (the ones
+    `key` was computed from), read from the store a page at a time
+    """
+    progress = job["progress"]
+    progress.update({"stage": "rendering", "messages_total": count, "messages_done": 0})
+
+    def messages():
+        for message in history_manager.iter_messages(user_id, stop=count):
+            yield message
+            progress["messages_done"] += 1
+
+    path = await asyncio.to_thread(generate_conversation_pdf, key, messages(), title)
+    return {"file_path": path}
+
+
+def enforce_retention():
+    """
+    Remove expired exports, then the least recently used ones until the
+    directory is within its file and byte limits
+    """
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    now = time.time()
+    files = []
+    for entry in os.scandir(EXPORT_DIR):
+        if not entry.is_file() or not entry.name.endswith(".pdf"):
+            continue
+        stat = entry.stat()
+        if now - stat.st_mtime > EXPORT_MAX_AGE:
+            _remove(entry.path)
+        else:
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    files.sort()  # oldest first
+    total = sum(size for _, size, _ in files)
+    while files and (len(files) > EXPORT_MAX_FILES or total > EXPORT_MAX_BYTES):
+        _, size, path = files.pop(0)
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print("⚠️ Could not remove export:", e)
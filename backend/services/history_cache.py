@@ -0,0 +1,206 @@
+# history_cache.py - write-behind LRU cache in front of the history store
+
+"""
+Keeps hot user histories in memory so get_history is served without touching
+the store. Writes land in the cache immediately and are queued; a background
+thread flushes the queue to the store every HISTORY_FLUSH_INTERVAL seconds,
+and main.py flushes once more at shutdown.
+
+The cache is per process. When running several uvicorn workers, set
+HISTORY_CACHE_SIZE=0 (or pin users to workers) so every worker reads the
+shared store directly.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from services import metrics
+from services.messages import Message
+
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "256"))  # users
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+
+_CLEAR = object()
+
+
+def _apply(messages: List[Message], ops: list) -> List[Message]:
+    for op in ops:
+        if op is _CLEAR:
+            messages = []
+        else:
+            messages.append(op)
+    return messages
+
+
+class HistoryCache:
+    def __init__(self, store_getter, max_users: int = HISTORY_CACHE_SIZE,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self._store_getter = store_getter
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, List[Message]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        # user_id -> ops not yet written to the store; kept separately from
+        # _entries so evicting a dirty user never loses or blocks on writes
+        self._pending: Dict[str, list] = {}
+
+        # _lock guards the in-memory state; _io_lock keeps a cache miss from
+        # reading the store while a flush is halfway through applying ops
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._stop = threading.Event()
+        self._flusher = None
+
+    # ---- reads -------------------------------------------------------
+
+    def _entry(self, user_id: str) -> List[Message]:
+        """
+        Return the live cached list for a user, loading it on a miss.
+        Caller must hold _lock; it is released around the store read.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            return entry
+
+        self.misses += 1
+        self._lock.release()
+        self._io_lock.acquire()
+        try:
+            base = self._store_getter().read(user_id)
+        finally:
+            # retake _lock before letting a flush run, so the ops still
+            # pending below are exactly the ones missing from `base`
+            self._lock.acquire()
+            self._io_lock.release()
+
+        entry = self._entries.get(user_id)  # another thread may have loaded it
+        if entry is None:
+            entry = _apply(list(base), self._pending.get(user_id, []))
+            self._entries[user_id] = entry
+            self._resize(user_id, sum(len(m.content) for m in entry))
+        return entry
+
+    def get(self, user_id: str) -> List[Message]:
+        with self._lock:
+            return list(self._entry(user_id))
+
+    def get_range(self, user_id: str, start=None, stop=None):
+        """
+        (history[start:stop], len(history)); copies only the slice
+        """
+        with self._lock:
+            entry = self._entry(user_id)
+            return entry[start:stop], len(entry)
+
+    # ---- writes ------------------------------------------------------
+
+    def append(self, user_id: str, message: Message):
+        with self._lock:
+            self._entry(user_id).append(message)
+            self._pending.setdefault(user_id, []).append(message)
+            self._resize(user_id, self._sizes.get(user_id, 0) + len(message.content))
+
+    def clear(self, user_id: str):
+        with self._lock:
+            self._entries[user_id] = []
+            self._entries.move_to_end(user_id)
+            # a clear supersedes anything queued before it
+            self._pending[user_id] = [_CLEAR]
+            self._resize(user_id, 0)
+
+    def flush(self):
+        """
+        Write every queued op to the store
+        """
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            store = self._store_getter()
+            with metrics.span("history_flush"):
+                for user_id, ops in pending.items():
+                    for i, op in enumerate(ops):
+                        try:
+                            if op is _CLEAR:
+                                store.clear(user_id)
+                            else:
+                                store.append(user_id, op)
+                        except Exception:
+                            self._requeue(user_id, ops[i:], pending)
+                            raise
+
+    def _requeue(self, failed_user: str, failed_ops: list, pending: dict):
+        """
+        Put unwritten ops back in front of anything queued since the flush began
+        """
+        with self._lock:
+            remaining = {failed_user: failed_ops}
+            users = list(pending)
+            for user_id in users[users.index(failed_user) + 1:]:
+                remaining[user_id] = pending[user_id]
+            for user_id, ops in remaining.items():
+                newer = self._pending.get(user_id, [])
+                self._pending[user_id] = ops + newer
+
+    # ---- eviction ----------------------------------------------------
+
+    def _resize(self, user_id: str, size: int):
+        if user_id not in self._entries:
+            return  # already evicted as too large
+        self._bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+        while self._entries and (
+            len(self._entries) > self.max_users or self._bytes > self.max_bytes
+        ):
+            evicted, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted, 0)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "pending_users": len(self._pending),
+            }
+
+    # ---- background flushing -----------------------------------------
+
+    def _flush_loop(self):
+        while not self._stop.wait(HISTORY_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception as e:
+                print("⚠️ History flush failed:", e)
+
+    def start(self):
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
@@ -1,34 +1,160 @@
-from typing import Dict, List
-import json
+import asyncio
 import os
+from typing import Dict, List
+from services.history_store import get_store
+from services.history_cache import HistoryCache, HISTORY_CACHE_SIZE
+from services import metrics, rolling_summary
+from services.messages import Message
+
+# Storage lives in history_store; HISTORY_BACKEND picks sqlite or jsonl.
+# data/conversations.json is imported once on first start.
+# Hot histories are served from a write-behind cache (HISTORY_CACHE_SIZE=0 disables it).
+# Every append also updates the user's rolling summary (see rolling_summary).
+
+# Page sizes for get_page (the /chat/history endpoint)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "500"))
+
+cache = HistoryCache(get_store) if HISTORY_CACHE_SIZE > 0 else None
+
+def add_message(user_id: str, content: str, role: str, tool: str = None) -> Message:
+    """
+    Append a message ("user", "assistant" or "system"); its token count and
+    hash are computed here, once
+    """
+    message = Message.create(role, content, tool)
+    with metrics.span("history_append"):
+        if cache:
+            cache.append(user_id, message)
+        else:
+            get_store().append(user_id, message)
+    rolling_summary.observe(user_id, message)
+    return message
+
+def get_history(user_id: str) -> List[Message]:
+    with metrics.span("history_read"):
+        if cache:
+            return cache.get(user_id)
+        return get_store().read(user_id)
+
+def _get_range(user_id: str, start=None, stop=None):
+    if cache:
+        return cache.get_range(user_id, start, stop)
+    return get_store().read_range(user_id, start, stop)
 
-STORE_PATH = "data/conversations.json"
+# A cursor names a position in the history plus the hash of the message
+# just before it ("12:3fa9..."), so a cursor from before a reset is detected
+# instead of silently skipping messages.
 
-def _load():
-    if not os.path.exists(STORE_PATH):
-        return {}
-    with open(STORE_PATH, "r") as f:
-        return json.load(f)
+def _make_cursor(position: int, last: Message = None) -> str:
+    return f"{position}:{last.hash}" if position and last else "0"
 
-def _save(data):
-    os.makedirs("data", exist_ok=True)
-    with open(STORE_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+def _parse_cursor(cursor: str):
+    position, _, last_hash = cursor.partition(":")
+    return int(position), last_hash
 
-def add_message(user_id: str, message: str):
-    store = _load()
-    store.setdefault(user_id, []).append(message)
-    _save(store)
+def iter_messages(user_id: str, stop: int = None, batch: int = HISTORY_PAGE_MAX):
+    """
+    Yield the history (up to position `stop`) one page at a time, so long
+    histories can be streamed without copying them whole
+    """
+    start = 0
+    while stop is None or start < stop:
+        end = start + batch if stop is None else min(start + batch, stop)
+        messages, _ = _get_range(user_id, start, end)
+        yield from messages
+        if len(messages) < end - start:
+            return
+        start = end
 
-def get_history(user_id: str):
-    store = _load()
-    return store.get(user_id, [])
+def latest(user_id: str):
+    """
+    (number of messages, last message or None) without reading the history
+    """
+    last, total = _get_range(user_id, -1, None)
+    return total, last[-1] if last else None
+
+def latest_cursor(user_id: str) -> str:
+    return _make_cursor(*latest(user_id))
+
+def get_page(user_id: str, since: str = None, before: int = None, limit: int = HISTORY_PAGE_SIZE) -> dict:
+    """
+    One page of history:
+      since=<cursor>  messages after the cursor, oldest first (delta sync)
+      before=<n>      the `limit` messages before position n (scrolling back)
+      neither         the latest `limit` messages
+    The returned cursor points after the last message returned; has_more
+    means there are newer messages to fetch with it. reset=True means the
+    cursor no longer matches (the conversation was cleared) and the page is
+    the latest messages instead.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    reset = False
+
+    if since is not None:
+        try:
+            position, last_hash = _parse_cursor(since)
+        except ValueError:
+            position, last_hash = -1, ""
+        if position == 0:
+            messages, total = _get_range(user_id, 0, limit)
+            start = 0
+        elif position > 0:
+            # Fetch the message before the cursor too, to check its hash
+            window, total = _get_range(user_id, position - 1, position + limit)
+            if window and window[0].hash == last_hash:
+                messages, start = window[1:], position
+            else:
+                reset = True
+        else:
+            reset = True
+
+    if since is None or reset:
+        if before is None:
+            messages, total = _get_range(user_id, -limit, None)
+            start = total - len(messages)
+        else:
+            start = max(before - limit, 0)
+            messages, total = _get_range(user_id, start, max(before, 0))
+
+    end = start + len(messages)
+    if messages:
+        cursor = _make_cursor(end, messages[-1])
+    elif since is not None and not reset:
+        cursor = since
+    else:
+        cursor = latest_cursor(user_id) if end >= total else _make_cursor(0)
+    return {
+        "messages": [m.to_dict() for m in messages],
+        "cursor": cursor,
+        "first": start,
+        "total": total,
+        "has_more": end < total,
+        "reset": reset,
+    }
 
 conversation_store: Dict[str, List[str]] = {}
 
 
 def clear_history(user_id: str):
-    store = _load()
-    if user_id in store:
-        store[user_id] = []
-        _save(store)
+    if cache:
+        cache.clear(user_id)
+    else:
+        get_store().clear(user_id)
+    rolling_summary.reset(user_id)
+
+def start():
+    """
+    Start background flushing of cached writes and run rolling summary
+    refreshes on the app's event loop (called from the app lifespan)
+    """
+    rolling_summary.bind_loop(asyncio.get_running_loop())
+    if cache:
+        cache.start()
+
+def shutdown():
+    """
+    Flush every pending write to the store
+    """
+    if cache:
+        cache.stop()
@@ -0,0 +1,407 @@
+# history_store.py - storage engines behind history_manager
+
+"""
+Append-only conversation storage.
+
+HISTORY_BACKEND selects the engine:
+  - "sqlite" (default): one row per message in a WAL-mode database
+  - "jsonl": one append-only log file per user, compacted in the background
+
+Both engines only touch the requesting user's records on read, so the cost
+of a chat turn no longer grows with the total size of the store.
+
+Histories are lists of messages.Message. Stores written before roles were
+recorded (and the old conversations.json) are migrated on startup; their
+roles are taken from position, user first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+from services.messages import Message, from_legacy, from_legacy_message
+from services.storage import file_lock, atomic_write_json, read_json
+
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite").lower()
+DATA_DIR = "data"
+LEGACY_STORE_PATH = os.path.join(DATA_DIR, "conversations.json")
+SQLITE_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(DATA_DIR, "conversations.db"))
+JSONL_DIR = os.getenv("HISTORY_DIR", os.path.join(DATA_DIR, "conversations"))
+COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "300"))
+
+
+def _load_legacy() -> Dict[str, List[str]]:
+    """
+    Read the old whole-file JSON store so it can be imported once
+    """
+    if not os.path.exists(LEGACY_STORE_PATH):
+        return {}
+    try:
+        with open(LEGACY_STORE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print("⚠️ Could not import legacy conversation store:", e)
+        return {}
+
+
+class SqliteHistoryStore:
+    """
+    One row per message, indexed by (user_id, id). WAL mode lets readers
+    run while a writer appends, and SQLite serializes writers across workers.
+    """
+
+    _COLUMNS = "role, content, created_at, tool, tokens, hash"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "user_id TEXT NOT NULL, "
+                "content TEXT NOT NULL, "
+                "role TEXT, "
+                "created_at REAL, "
+                "tool TEXT, "
+                "tokens INTEGER, "
+                "hash TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS summaries (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._migrate_roles()
+        self._import_legacy()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads, and FastAPI
+        # runs sync endpoints in a threadpool, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self):
+        conn = self._conn()
+        with conn:
+            # Take the write lock before checking, so two workers starting
+            # together cannot both import
+            conn.execute("BEGIN IMMEDIATE")
+            done = conn.execute("SELECT value FROM meta WHERE key = 'legacy_import'").fetchone()
+            if done:
+                return
+            rows = [
+                self._row(user_id, message)
+                for user_id, messages in _load_legacy().items()
+                for message in from_legacy(messages)
+            ]
+            conn.executemany(f"INSERT INTO messages (user_id, {self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_import', ?)", (str(time.time()),))
+
+    def _migrate_roles(self):
+        """
+        Databases created before messages had roles: add the columns and
+        fill them in for existing rows
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            for column, kind in (("role", "TEXT"), ("created_at", "REAL"), ("tool", "TEXT"),
+                                 ("tokens", "INTEGER"), ("hash", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {kind}")
+
+            users = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM messages WHERE role IS NULL")]
+            for user_id in users:
+                rows = conn.execute(
+                    "SELECT id, content, role FROM messages WHERE user_id = ? ORDER BY id", (user_id,)
+                ).fetchall()
+                updates = []
+                for index, (row_id, content, role) in enumerate(rows):
+                    if role is None:
+                        message = from_legacy_message(content, index)
+                        updates.append((message.role, message.tokens, message.hash, row_id))
+                conn.executemany("UPDATE messages SET role = ?, tokens = ?, hash = ? WHERE id = ?", updates)
+
+    @staticmethod
+    def _row(user_id: str, message: Message) -> tuple:
+        return (user_id, message.role, message.content, message.timestamp,
+                message.tool, message.tokens, message.hash)
+
+    def append(self, user_id: str, message: Message):
+        with self._conn() as conn:
+            conn.execute(f"INSERT INTO messages (user_id, {self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         self._row(user_id, message))
+
+    def read(self, user_id: str) -> List[Message]:
+        rows = self._conn().execute(
+            f"SELECT {self._COLUMNS} FROM messages WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall()
+        return [Message(*row) for row in rows]  # columns are in Message field order
+
+    def read_range(self, user_id: str, start=None, stop=None):
+        """
+        (history[start:stop], len(history)) without loading the rest
+        """
+        conn = self._conn()
+        total = conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
+        start, stop, _ = slice(start, stop).indices(total)
+        if stop <= start:
+            return [], total
+        rows = conn.execute(
+            f"SELECT {self._COLUMNS} FROM messages WHERE user_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (user_id, stop - start, start),
+        ).fetchall()
+        return [Message(*row) for row in rows], total
+
+    def clear(self, user_id: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+
+    def get_summary(self, user_id: str):
+        row = self._conn().execute("SELECT data FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_summary(self, user_id: str, data):
+        """
+        Store the rolling conversation summary for a user (None deletes it)
+        """
+        with self._conn() as conn:
+            if data is None:
+                conn.execute("DELETE FROM summaries WHERE user_id = ?", (user_id,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO summaries (user_id, data) VALUES (?, ?)",
+                             (user_id, json.dumps(data)))
+
+    def compact(self):
+        """
+        Fold the write-ahead log back into the main database file
+        """
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class JsonlHistoryStore:
+    """
+    One append-only log per user. Each line is a record: a message
+    (Message.to_record(), {"m": content, "r": role, ...}) or {"clear": true}
+    as a tombstone. Reads seek straight past the
+    last tombstone using an in-memory offset index; compaction rewrites logs
+    that carry dead records. Every mutation of a log holds its file_lock, so
+    several workers can share the directory.
+    """
+
+    def __init__(self, directory: str = JSONL_DIR):
+        self.directory = directory
+        # user_id -> (inode, byte offset where the live records start); the
+        # inode changes when another worker compacts the log
+        self._live_offset: Dict[str, tuple] = {}
+        # Guards _live_offset: readers, clears and the compaction thread all
+        # update it, and reads take no file lock
+        self._offset_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._import_legacy()
+        self._migrate_roles()
+
+    def _path(self, user_id: str) -> str:
+        # user ids come from clients, so never use them as file names directly
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.jsonl")
+
+    def _import_legacy(self):
+        marker = os.path.join(self.directory, ".legacy_imported")
+        with file_lock(marker):
+            if os.path.exists(marker):
+                return
+            for user_id, messages in _load_legacy().items():
+                for message in from_legacy(messages):
+                    self.append(user_id, message)
+            with open(marker, "w") as f:
+                f.write(str(time.time()))
+
+    def _write_record(self, user_id: str, record: dict) -> int:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self._path(user_id), "a", encoding="utf-8") as f:
+            f.write(line)
+            return f.tell()
+
+    def _migrate_roles(self):
+        """
+        Rewrite logs from before messages had roles, so every record carries
+        its role, token count and hash (old tombstoned records are dropped)
+        """
+        marker = os.path.join(self.directory, ".roles_migrated")
+        with file_lock(marker):
+            if os.path.exists(marker):
+                return
+            for name in os.listdir(self.directory):
+                if not name.endswith(".jsonl"):
+                    continue
+                path = os.path.join(self.directory, name)
+                with file_lock(path):
+                    messages = self._read_live(path)
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        for message in messages:
+                            f.write(json.dumps(message.to_record(), ensure_ascii=False) + "\n")
+                    os.replace(tmp_path, path)
+            with open(marker, "w") as f:
+                f.write(str(time.time()))
+
+    def append(self, user_id: str, message: Message):
+        with file_lock(self._path(user_id)):
+            self._write_record(user_id, message.to_record())
+
+    def clear(self, user_id: str):
+        path = self._path(user_id)
+        with file_lock(path):
+            if not os.path.exists(path):
+                return
+            offset = self._write_record(user_id, {"clear": True})
+            with self._offset_lock:
+                self._live_offset[user_id] = (os.stat(path).st_ino, offset)
+
+    def _scan(self, user_id: str):
+        """
+        Return (live messages, offset of the live region, has dead records)
+        """
+        path = self._path(user_id)
+        if not os.path.exists(path):
+            return [], 0, False
+
+        with open(path, "r", encoding="utf-8") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            with self._offset_lock:
+                cached_inode, start = self._live_offset.get(user_id, (None, 0))
+            if cached_inode != inode:
+                start = 0
+            messages, live_start = self._read_records(f, start)
+        with self._offset_lock:
+            self._live_offset[user_id] = (inode, live_start)
+        return messages, live_start, live_start > 0
+
+    def _read_live(self, path: str) -> List[Message]:
+        with open(path, "r", encoding="utf-8") as f:
+            return self._read_records(f, 0)[0]
+
+    @staticmethod
+    def _read_records(f, start: int):
+        """
+        Messages after the last tombstone at or past `start`, and where they begin
+        """
+        messages: List[Message] = []
+        live_start = start
+        f.seek(start)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if not line.endswith("\n"):
+                break  # partial trailing write, ignore until it completes
+            record = json.loads(line)
+            if record.get("clear"):
+                messages = []
+                live_start = f.tell()
+            else:
+                messages.append(Message.from_record(record, len(messages)))
+        return messages, live_start
+
+    def get_summary(self, user_id: str):
+        return read_json(self._path(user_id)[:-len(".jsonl")] + ".summary.json", default={})[0] or None
+
+    def set_summary(self, user_id: str, data):
+        path = self._path(user_id)[:-len(".jsonl")] + ".summary.json"
+        if data is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            atomic_write_json(path, data)
+
+    def read(self, user_id: str) -> List[Message]:
+        # Appends and compactions are atomic to readers (whole lines, and
+        # os.replace), so reads do not need the lock
+        return self._scan(user_id)[0]
+
+    def read_range(self, user_id: str, start=None, stop=None):
+        messages = self.read(user_id)
+        return messages[start:stop], len(messages)
+
+    def compact(self):
+        """
+        Rewrite every log that still carries records before its last tombstone
+        """
+        with self._offset_lock:
+            known_users = list(self._live_offset)
+        users_by_path: Dict[str, list] = {}
+        for user_id in known_users:
+            users_by_path.setdefault(self._path(user_id), []).append(user_id)
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.directory, name)
+            with file_lock(path):
+                offset = self._find_live_offset(path)
+                if offset == 0:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    f.seek(offset)
+                    live = f.read()
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(live)
+                os.replace(tmp_path, path)
+                with self._offset_lock:
+                    for user_id in users_by_path.get(path, []):
+                        self._live_offset.pop(user_id, None)
+
+    @staticmethod
+    def _find_live_offset(path: str) -> int:
+        offset = 0
+        with open(path, "r", encoding="utf-8") as f:
+            while True:
+                line = f.readline()
+                if not line or not line.endswith("\n"):
+                    break
+                if '"clear"' in line and json.loads(line).get("clear"):
+                    offset = f.tell()
+        return offset
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _compaction_loop(store):
+    while True:
+        time.sleep(COMPACT_INTERVAL)
+        try:
+            store.compact()
+        except Exception as e:
+            print("⚠️ History compaction failed:", e)
+
+
+def get_store():
+    """
+    Return the configured history store, creating it on first use
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if HISTORY_BACKEND == "jsonl":
+                    store = JsonlHistoryStore()
+                else:
+                    store = SqliteHistoryStore()
+                if COMPACT_INTERVAL > 0:
+                    threading.Thread(target=_compaction_loop, args=(store,), daemon=True).start()
+                _store = store
+    return _store
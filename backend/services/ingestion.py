@@ -0,0 +1,126 @@
+# ingestion.py - background document ingestion for /tools/upload
+
+"""
+Uploads are saved to disk by the endpoint and handed to this job queue, so
+the request returns at once. INGEST_WORKERS documents are processed at a
+time; at most INGEST_QUEUE_SIZE more may wait before uploads are refused.
+Each job reports its stage, pages extracted and whether the summary is done,
+and stores the summary in the user's history when it completes.
+
+Extracted text and summaries are kept in the artifact store under the
+SHA-256 of the uploaded bytes, so a file that was uploaded before (by any
+user) is indexed and summarized again without parsing or LLM calls.
+"""
+
+import asyncio
+import os
+
+from services import artifacts, document_parser, history_manager, llm_scheduler, metrics, summarizer, document_index
+from services.jobs import JobQueue
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+
+queue = JobQueue("ingestion", INGEST_WORKERS, INGEST_QUEUE_SIZE)
+
+
+def _extract(job, file_path, file_extension):
+    """
+    Runs in a worker thread; reports page progress as pages come out.
+    Returns the text and the offset in it where each page starts.
+    """
+    progress = job["progress"]
+    if file_extension != ".pdf":
+        return document_parser.extract_text_from_document(file_path, file_extension), [0]
+
+    total = document_parser.count_pdf_pages(file_path)
+    progress["pages_total"] = total
+    parallel = document_parser.PDF_WORKERS > 1 and total >= document_parser.PDF_PARALLEL_MIN_PAGES
+    pages, offsets, offset = [], [], 0
+    for text in document_parser.iter_pdf_text(file_path, parallel=parallel):
+        pages.append(text)
+        offsets.append(offset)
+        offset += len(text) + 1  # pages are joined with "\n"
+        progress["pages_extracted"] = len(pages)
+    return "\n".join(pages), offsets
+
+
+def _load_or_extract(job, file_path, file_extension, sha):
+    """
+    Text of the upload, from the artifact store when this file was seen before
+    """
+    progress = job["progress"]
+    cached = artifacts.get(sha) if sha else None
+    if cached is not None:
+        progress.update({"cached": True, "pages_total": len(cached["page_offsets"]),
+                         "pages_extracted": len(cached["page_offsets"])})
+        return artifacts.load_text(sha), cached
+
+    with metrics.span("document_extract", file_type=file_extension):
+        content, offsets = _extract(job, file_path, file_extension)
+    if sha and not content.startswith(("Error", "Unsupported")):
+        try:
+            artifacts.put_text(sha, content, file_extension, offsets)
+        except OSError as e:
+            print("⚠️ Could not store document artifact:", e)
+    return content, None
+
+
+async def ingest_document(job, file_path, filename, file_extension, user_id, sha=None):
+    """
+    Job: extract, index and summarize one upload; `sha` is the SHA-256 of
+    its bytes, used as the artifact store key
+    """
+    progress = job["progress"]
+    progress.update({"stage": "extracting", "pages_extracted": 0, "summary_done": False, "cached": False})
+    try:
+        content, cached = await asyncio.to_thread(_load_or_extract, job, file_path, file_extension, sha)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    # Check if extraction was successful
+    if content.startswith("Error"):
+        raise ValueError(content)
+
+    # Keep the full text searchable for follow-up questions
+    progress["stage"] = "indexing"
+    await asyncio.to_thread(document_index.add_document, user_id, filename, content, sha)
+    progress["indexed"] = True
+
+    # Summarize the whole document (map-reduce over chunks)
+    progress["stage"] = "summarizing"
+
+    def on_progress(level, done, total):
+        progress.update({"summary_level": level, "chunks_done": done, "chunks_total": total})
+
+    summary = cached["summaries"].get("text") if cached else None
+    if summary is None:
+        # Counted against the uploader's quota, behind interactive calls
+        with llm_scheduler.scope(user_id, llm_scheduler.BACKGROUND):
+            summary = await summarizer.summarize_document(content, on_progress=on_progress)
+        # A failed summary fails the job rather than being saved as one
+        # (the document stays indexed for questions)
+        if summary.startswith("Error"):
+            raise ValueError(summary)
+        if sha:
+            await asyncio.to_thread(artifacts.put_summary, sha, summary)
+    progress["summary_done"] = True
+
+    # Determine file icon based on type
+    file_icon = "📄" if file_extension == '.pdf' else "📝"
+
+    # Save to conversation history
+    summary_message = f"{file_icon} Uploaded **{filename}**\n\n📝 Summary:\n{summary}"
+    # A lone assistant message; its role is stored, so it does not shift
+    # the user/assistant pairing of later messages
+    await asyncio.to_thread(history_manager.add_message, user_id, summary_message, "assistant", "upload")
+    progress["stage"] = "done"
+
+    return {
+        "filename": filename,
+        "file_type": file_extension,
+        "extracted_content": content[:500] + "..." if len(content) > 500 else content,
+        "summary": summary,
+        "success": True
+    }
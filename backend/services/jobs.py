@@ -0,0 +1,197 @@
+# jobs.py - bounded background job queues with pollable status
+
+"""
+A JobQueue runs async jobs on a fixed number of worker tasks. submit()
+returns a job record immediately; its status ("queued", "running", "done",
+"failed"), progress dict and result can be polled by id. When the queue is
+full, submit() raises QueueFull so the endpoint can push back on the client
+instead of piling up work.
+
+Job records are also written to an SQLite table (JOB_DB_PATH), so with
+several uvicorn workers a poll can be answered by any of them, not only by
+the worker running the job. The running worker writes status changes at
+once and progress every JOB_SYNC_INTERVAL seconds. Records are kept for
+JOB_RETENTION seconds after they finish.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "data/jobs.db")
+JOB_SYNC_INTERVAL = float(os.getenv("JOB_SYNC_INTERVAL", "0.5"))
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOB_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOB_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, queue TEXT NOT NULL, status TEXT NOT NULL, progress TEXT NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        _local.conn = conn
+    return conn
+
+
+def _save(queue: str, jobs: list):
+    with _conn() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO jobs (id, queue, status, progress, result, error, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(job["id"], queue, job["status"], json.dumps(job["progress"]), json.dumps(job["result"]),
+              job["error"], job["created_at"], job["updated_at"]) for job in jobs],
+        )
+
+
+def _load(queue: str, job_id: str) -> dict | None:
+    row = _conn().execute(
+        "SELECT id, status, progress, result, error, created_at, updated_at FROM jobs WHERE queue = ? AND id = ?",
+        (queue, job_id),
+    ).fetchone()
+    if row is None:
+        return None
+    return {"id": row[0], "status": row[1], "progress": json.loads(row[2]), "result": json.loads(row[3]),
+            "error": row[4], "created_at": row[5], "updated_at": row[6]}
+
+
+def _delete(queue: str, job_id: str):
+    with _conn() as conn:
+        conn.execute("DELETE FROM jobs WHERE queue = ? AND id = ?", (queue, job_id))
+
+
+def _prune_store(queue: str, cutoff: float):
+    with _conn() as conn:
+        conn.execute("DELETE FROM jobs WHERE queue = ? AND status IN ('done', 'failed') AND updated_at < ?",
+                     (queue, cutoff))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, name: str, workers: int, max_queued: int):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.jobs: dict = {}  # jobs submitted to this process
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list = []
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._sync_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        # Jobs cancelled at shutdown are recorded as failed
+        await self._persist(list(self.jobs.values()))
+
+    async def submit(self, fn, *args, **kwargs) -> dict:
+        """
+        Queue `fn(job, *args, **kwargs)`; fn is a coroutine function that may
+        update job["progress"] and whose return value becomes job["result"]
+        """
+        if self._queue is None:
+            raise RuntimeError(f"Job queue {self.name} is not running")
+        if self._queue.full():
+            raise QueueFull(f"{self.name} queue is full ({self.max_queued} jobs waiting)")
+        self._prune()
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        # Stored before it is queued, so a poll to any worker finds it
+        await asyncio.to_thread(_save, self.name, [job])
+        try:
+            self._queue.put_nowait((job, fn, args, kwargs))
+        except asyncio.QueueFull:  # filled up while the record was written
+            await asyncio.to_thread(_delete, self.name, job["id"])
+            raise QueueFull(f"{self.name} queue is full ({self.max_queued} jobs waiting)")
+        self.jobs[job["id"]] = job
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        return await asyncio.to_thread(_load, self.name, job_id)  # submitted to another worker
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"queued": self._queue.qsize() if self._queue else 0, "jobs": counts}
+
+    async def _persist(self, jobs: list):
+        if not jobs:
+            return
+        try:
+            await asyncio.to_thread(_save, self.name, jobs)
+        except Exception as e:
+            print(f"⚠️ Could not store {self.name} job status:", e)
+
+    async def _worker(self):
+        while True:
+            job, fn, args, kwargs = await self._queue.get()
+            job["status"] = "running"
+            job["updated_at"] = time.time()
+            await self._persist([job])
+            try:
+                job["result"] = await fn(job, *args, **kwargs)
+                job["status"] = "done"
+            except asyncio.CancelledError:
+                job["status"] = "failed"
+                job["error"] = "Cancelled at shutdown"
+                raise
+            except Exception as e:
+                print(f"⚠️ {self.name} job {job['id']} failed:", e)
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["updated_at"] = time.time()
+                self._queue.task_done()
+            await self._persist([job])
+
+    async def _sync_loop(self):
+        """
+        Write the progress of running jobs and drop expired records
+        """
+        while True:
+            await asyncio.sleep(JOB_SYNC_INTERVAL)
+            await self._persist([job for job in self.jobs.values() if job["status"] == "running"])
+            try:
+                await asyncio.to_thread(_prune_store, self.name, time.time() - JOB_RETENTION)
+            except Exception as e:
+                print(f"⚠️ Could not prune {self.name} jobs:", e)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [j["id"] for j in self.jobs.values()
+                       if j["status"] in ("done", "failed") and j["updated_at"] < cutoff]:
+            del self.jobs[job_id]
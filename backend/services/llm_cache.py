@@ -0,0 +1,110 @@
+# llm_cache.py - content-addressed cache for repeatable LLM calls
+
+"""
+Caches completions keyed on a hash of (model, normalized messages,
+temperature), so asking the same thing twice costs no upstream tokens.
+
+Caching is opt-in per call site: call_llm / call_llm_with_messages take a
+`cache_tag` ("topic", "summary", "evaluate", ...), and only tags listed in
+LLM_CACHE_TOOLS are cached. Free-form chat is never cached.
+
+Tiers: an in-memory LRU (LLM_CACHE_SIZE entries) in front of an optional
+SQLite file (LLM_CACHE_DISK=1, at LLM_CACHE_PATH) that survives restarts
+and is shared by workers. Entries expire after LLM_CACHE_TTL seconds.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from services.cache import TTLCache
+
+LLM_CACHE_TOOLS = {
+    t.strip() for t in os.getenv("LLM_CACHE_TOOLS", "topic,summary,evaluate,search_expand").split(",") if t.strip()
+}
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_DISK = os.getenv("LLM_CACHE_DISK", "0") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+
+_memory = TTLCache(LLM_CACHE_SIZE, LLM_CACHE_TTL)
+_tag_stats: dict = {}  # tag -> {"hits": n, "misses": n}
+_local = threading.local()
+
+
+def enabled_for(tag: str | None) -> bool:
+    return tag is not None and tag in LLM_CACHE_TOOLS
+
+
+def _normalize(messages: list) -> list:
+    return [
+        {
+            "role": str(m.get("role", "")).strip().lower(),
+            "content": "\n".join(line.rstrip() for line in str(m.get("content", "")).strip().splitlines()),
+        }
+        for m in messages
+    ]
+
+
+def make_key(model, messages: list, temperature: float) -> str:
+    raw = json.dumps(
+        {"model": model, "messages": _normalize(messages), "temperature": temperature},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _disk():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        with conn:
+            conn.execute("DELETE FROM completions WHERE expires_at < ?", (time.time(),))
+        _local.conn = conn
+    return conn
+
+
+def _count(tag: str, hit: bool):
+    stats = _tag_stats.setdefault(tag, {"hits": 0, "misses": 0})
+    stats["hits" if hit else "misses"] += 1
+
+
+def get(key: str, tag: str):
+    value = _memory.get(key)
+    if value is None and LLM_CACHE_DISK:
+        row = _disk().execute(
+            "SELECT value, expires_at FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row and row[1] > time.time():
+            value = row[0]
+            _memory.set(key, value)
+    _count(tag, value is not None)
+    return value
+
+
+def put(key: str, value: str):
+    _memory.set(key, value)
+    if LLM_CACHE_DISK:
+        with _disk() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + LLM_CACHE_TTL),
+            )
+
+
+def stats() -> dict:
+    per_tag = {}
+    for tag, s in _tag_stats.items():
+        lookups = s["hits"] + s["misses"]
+        per_tag[tag] = {**s, "hit_rate": s["hits"] / lookups if lookups else 0.0}
+    return {"memory": _memory.stats(), "tags": per_tag}
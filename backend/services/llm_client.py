@@ -0,0 +1,122 @@
+# llm_client.py - shared async client for the OpenAI-compatible NGU endpoint
+
+"""
+One httpx.AsyncClient per process, so every LLM call reuses pooled
+keep-alive connections instead of paying a new TCP/TLS handshake, and an
+endpoint awaiting a completion does not hold a threadpool worker.
+
+Tuning (environment):
+  LLM_TIMEOUT            read timeout for a completion, seconds (default 120)
+  LLM_CONNECT_TIMEOUT    connect timeout, seconds (default 10)
+  LLM_MAX_CONNECTIONS    pool size (default 200)
+  LLM_MAX_KEEPALIVE      idle connections kept open (default 50)
+  LLM_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 30)
+
+Every call first takes a slot from llm_scheduler (global concurrency cap,
+per-user quotas, priorities).
+"""
+
+import json
+import os
+import httpx
+from dotenv import load_dotenv
+
+from services import llm_scheduler, metrics
+
+load_dotenv()
+
+API_KEY = os.getenv("NGU_API_KEY")
+BASE_URL = os.getenv("NGU_BASE_URL")
+MODEL = os.getenv("NGU_MODEL")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+TEMPERATURE = 0.7
+
+headers = {
+    "Authorization": f"Bearer {API_KEY}",
+    "Content-Type": "application/json"
+}
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL or "",
+            headers=headers,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def chat_completion(messages: list, temperature: float = TEMPERATURE) -> dict:
+    """
+    POST /chat/completions and return the decoded response body.
+    Raises httpx errors; callers decide how to report them.
+    """
+    payload = {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": temperature
+    }
+    async with llm_scheduler.slot():
+        metrics.inc("llm_requests_total", mode="completion")
+        with metrics.span("llm_request"):
+            response = await get_client().post("/chat/completions", json=payload)
+            response.raise_for_status()
+            data = response.json()
+    metrics.record_usage(data)
+    return data
+
+
+async def stream_chat_completion(messages: list, temperature: float = TEMPERATURE):
+    """
+    POST /chat/completions with "stream": true and yield content deltas
+    as the server sends them (OpenAI-style server-sent events).
+    """
+    payload = {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True
+    }
+    async with llm_scheduler.slot():
+        metrics.inc("llm_requests_total", mode="stream")
+        with metrics.span("llm_stream"):
+            async with get_client().stream("POST", "/chat/completions", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    metrics.record_usage(chunk)  # servers that report usage send it in the last chunk
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+
+async def close():
+    """
+    Close pooled connections (called from the app lifespan)
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
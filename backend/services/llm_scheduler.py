@@ -0,0 +1,197 @@
+# llm_scheduler.py - admission control and fair ordering of upstream LLM calls
+
+"""
+Every completion and stream in llm_client takes a slot here first.
+
+- At most LLM_MAX_CONCURRENCY calls are in flight across all users.
+- Each user has a token bucket of LLM_USER_BURST interactive calls
+  refilled at LLM_USER_RATE calls per second, so one user's qa or
+  react_agent burst cannot monopolize the provider. A call that gives up
+  (timeout, cancellation) before getting a slot gets its token back.
+  BACKGROUND work is not charged to the bucket: a document summary makes
+  one call per chunk, and it already yields to interactive calls.
+- Waiting calls are ordered by priority class (INTERACTIVE before
+  BACKGROUND) and, within a class, round-robin across users.
+- A call that cannot start before its deadline (LLM_QUEUE_TIMEOUT, or
+  LLM_BACKGROUND_QUEUE_TIMEOUT for background work) fails with LLMBusy
+  instead of queueing without bound; reasoning reports it like any other
+  LLM error.
+
+The user and priority of a call come from context variables: endpoints
+call set_user(), and background work (document and conversation summaries,
+topic titles) runs inside scope(priority=BACKGROUND). Tasks started from a
+request (gather, create_task) inherit both. Work coalesced with
+SingleFlight that calls the LLM includes current() in its key, so a shared
+call only serves callers it is correctly attributed and prioritized for.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from services import metrics
+from services.cache import TTLCache
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_USER_RATE = float(os.getenv("LLM_USER_RATE", "2"))     # calls per second, per user
+LLM_USER_BURST = float(os.getenv("LLM_USER_BURST", "16"))  # bucket size
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_BACKGROUND_QUEUE_TIMEOUT = float(os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT", "300"))
+LLM_SCHEDULER_USERS = 4096  # buckets kept; an evicted user starts with a full bucket
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_user = contextvars.ContextVar("llm_user", default=None)
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class LLMBusy(Exception):
+    """
+    The call could not be admitted before its deadline
+    """
+
+
+def set_user(user_id: str | None):
+    """
+    Attribute LLM calls made by the current request to `user_id`
+    """
+    _user.set(user_id)
+
+
+def current() -> tuple:
+    """
+    (user, priority) that LLM calls made from here are attributed to
+    """
+    return _user.get(), _priority.get()
+
+
+@contextmanager
+def scope(user_id: str | None = None, priority: int | None = None):
+    """
+    Run a block as `user_id` and/or at `priority`, restoring the previous
+    values afterwards (for job workers that serve many users)
+    """
+    user_token = _user.set(user_id) if user_id is not None else None
+    priority_token = _priority.set(priority) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            _priority.reset(priority_token)
+        if user_token is not None:
+            _user.reset(user_token)
+
+
+_buckets = TTLCache(LLM_SCHEDULER_USERS)
+_queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}  # priority -> user -> deque of futures
+_in_flight = 0
+_counts = {"admitted": 0, "rejected_quota": 0, "rejected_timeout": 0}
+
+
+def _take_token(user_id, deadline: float) -> float:
+    """
+    Reserve one call from the user's bucket; returns how long to wait for it
+    """
+    if user_id is None or LLM_USER_RATE <= 0:
+        return 0.0
+    now = time.monotonic()
+    bucket = _buckets.get(user_id)
+    if bucket is None:
+        bucket = [LLM_USER_BURST, now]
+        _buckets.set(user_id, bucket)
+    tokens = min(LLM_USER_BURST, bucket[0] + (now - bucket[1]) * LLM_USER_RATE)
+    wait = max(0.0, (1 - tokens) / LLM_USER_RATE)
+    if now + wait > deadline:
+        _counts["rejected_quota"] += 1
+        raise LLMBusy(f"LLM quota exceeded for {user_id}; retry in {wait:.0f}s")
+    bucket[0], bucket[1] = tokens - 1, now
+    return wait
+
+
+def _refund_token(user_id):
+    bucket = _buckets.get(user_id) if user_id is not None else None
+    if bucket is not None:
+        bucket[0] = min(LLM_USER_BURST, bucket[0] + 1)
+
+
+def _dispatch():
+    """
+    Hand free slots to waiters: highest priority first, users in turn
+    """
+    global _in_flight
+    for priority in (INTERACTIVE, BACKGROUND):
+        users = _queues[priority]
+        while users and _in_flight < LLM_MAX_CONCURRENCY:
+            user, waiters = next(iter(users.items()))
+            future = waiters.popleft()
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if not future.done():  # skip callers that gave up
+                _in_flight += 1
+                future.set_result(None)
+
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+    _dispatch()
+
+
+@asynccontextmanager
+async def slot():
+    """
+    Hold one upstream call slot for the duration of the block
+    """
+    global _in_flight
+    user_id, priority = _user.get(), _priority.get()
+    started = time.monotonic()
+    deadline = started + (LLM_BACKGROUND_QUEUE_TIMEOUT if priority == BACKGROUND else LLM_QUEUE_TIMEOUT)
+
+    charged = priority == INTERACTIVE
+    wait = _take_token(user_id, deadline) if charged else 0.0
+    try:
+        if wait:
+            await asyncio.sleep(wait)
+
+        # Callers never overtake waiters of the same or a higher priority
+        if _in_flight < LLM_MAX_CONCURRENCY and not any(_queues[p] for p in _queues if p <= priority):
+            _in_flight += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            _queues[priority].setdefault(user_id, deque()).append(future)
+            try:
+                await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                _counts["rejected_timeout"] += 1
+                raise LLMBusy("LLM is busy; the request could not be started in time") from None
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    _release()  # the slot was granted as we were cancelled
+                raise
+    except (LLMBusy, asyncio.CancelledError):
+        if charged:
+            _refund_token(user_id)  # no call was made
+        raise
+
+    _counts["admitted"] += 1
+    metrics.observe("stage_seconds", time.monotonic() - started, stage="llm_queue",
+                    priority=PRIORITY_NAMES[priority])
+    try:
+        yield
+    finally:
+        _release()
+
+
+def stats() -> dict:
+    return {
+        "in_flight": _in_flight,
+        "queued": {PRIORITY_NAMES[p]: sum(len(w) for w in users.values()) for p, users in _queues.items()},
+        **_counts,
+    }
@@ -0,0 +1,97 @@
+# messages.py - the record type stored in conversation histories
+
+"""
+Every history entry is a Message: who said it (role), when, which tool
+produced it, and its token count and content hash. Token count and hash
+are computed once when the message is created and stored with it, so
+context building and caching never have to recount or rehash history.
+
+Histories saved before roles were stored (plain strings) are converted by
+from_legacy(), which is the only place roles are still inferred from
+position (user, assistant, user, ...).
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from services.tokens import count_tokens
+
+ROLES = ("user", "assistant", "system")
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    role: str
+    content: str
+    timestamp: Optional[float]  # None for messages imported from old stores
+    tool: Optional[str]
+    tokens: int
+    hash: str
+
+    @classmethod
+    def create(cls, role: str, content: str, tool: str = None, timestamp: float = None) -> "Message":
+        if role not in ROLES:
+            raise ValueError(f"Unknown message role: {role}")
+        return cls(
+            role=role,
+            content=content,
+            timestamp=time.time() if timestamp is None else timestamp,
+            tool=tool,
+            tokens=count_tokens(content),
+            hash=content_hash(content),
+        )
+
+    # Compact form used by the JSONL store: {"m": content, "r": role, ...}
+    def to_record(self) -> dict:
+        record = {"m": self.content, "r": self.role, "ts": self.timestamp, "n": self.tokens, "h": self.hash}
+        if self.tool:
+            record["tool"] = self.tool
+        return record
+
+    @classmethod
+    def from_record(cls, record: dict, index: int = 0) -> "Message":
+        """
+        Rebuild a message from to_record() output; records written before
+        roles were stored only have "m", and get their role from `index`
+        """
+        if "r" not in record:
+            return from_legacy_message(record["m"], index)
+        return cls(
+            role=record["r"],
+            content=record["m"],
+            timestamp=record.get("ts"),
+            tool=record.get("tool"),
+            tokens=record["n"],
+            hash=record["h"],
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp,
+            "tool": self.tool,
+            "tokens": self.tokens,
+            "hash": self.hash,
+        }
+
+
+def _legacy_role(index: int) -> str:
+    return "user" if index % 2 == 0 else "assistant"
+
+
+def from_legacy(messages: List[str]) -> List[Message]:
+    """
+    Convert an old list-of-strings history, which alternated user/assistant
+    """
+    return [from_legacy_message(content, i) for i, content in enumerate(messages)]
+
+
+def from_legacy_message(content: str, index: int) -> Message:
+    return Message(_legacy_role(index), content, None, None, count_tokens(content), content_hash(content))
@@ -0,0 +1,233 @@
+# metrics.py - latency, token and cache instrumentation exported as /metrics
+
+"""
+In-process metrics rendered in the Prometheus text format by GET /metrics.
+
+- http_request_seconds: latency of every request by method, endpoint
+  and status (middleware in main.py).
+- span(stage, **labels): times a block into the synthesistalk_stage_seconds
+  histogram and counts synthesistalk_errors_total when it raises. Stages:
+  history_read, history_append, history_flush, context_prepare, tool,
+  llm_queue, llm_request, llm_stream, search_provider, document_extract.
+- timed(stage): the same as a decorator for sync or async functions.
+- observe(name, seconds, **labels) and inc(name, value, **labels) for
+  histograms and counters recorded directly (e.g. LLM token usage).
+- Cache and queue statistics are not recorded per event; the existing
+  stats() functions are read when /metrics is scraped.
+
+METRICS_ENABLED=0 turns recording off: span() returns a shared no-op,
+timed() leaves functions undecorated and the HTTP middleware is not
+installed, so the instrumented code paths cost one flag check.
+"""
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PREFIX = "synthesistalk_"
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "http_request_seconds": "HTTP request latency by endpoint (streamed responses: until headers are sent)",
+    "stage_seconds": "Time spent in each request stage",
+    "errors_total": "Stages that ended with an exception",
+    "llm_requests_total": "LLM completions requested",
+    "llm_prompt_tokens_total": "Prompt tokens reported by the LLM endpoint",
+    "llm_completion_tokens_total": "Completion tokens reported by the LLM endpoint",
+    "stats": "Cache and queue statistics (hits, misses, hit_rate, sizes)",
+}
+
+_lock = threading.Lock()
+_histograms: dict = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters: dict = {}    # (name, labels) -> value
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name: str, seconds: float, **labels):
+    if not METRICS_ENABLED:
+        return
+    index = bisect.bisect_left(BUCKETS, seconds)
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        series[index] += 1
+        series[-1] += seconds
+
+
+def inc(name: str, value: float = 1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Span:
+    __slots__ = ("labels", "start")
+
+    def __init__(self, labels: dict):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe("stage_seconds", time.perf_counter() - self.start, **self.labels)
+        # Cancellation and closed generators (BaseException) are not errors
+        if exc_type is not None and issubclass(exc_type, Exception):
+            inc("errors_total", **self.labels)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str, **labels):
+    """
+    Context manager timing one stage, e.g. `with metrics.span("tool", tool=name):`
+    """
+    if not METRICS_ENABLED:
+        return _NO_SPAN
+    return _Span({"stage": stage, **labels})
+
+
+def timed(stage: str):
+    """
+    Decorator form of span() for sync and async functions
+    """
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _Span({"stage": stage}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span({"stage": stage}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_usage(data: dict):
+    """
+    Count the token usage of an OpenAI-style response (or final stream chunk)
+    """
+    usage = data.get("usage") if METRICS_ENABLED else None
+    if not usage:
+        return
+    inc("llm_prompt_tokens_total", usage.get("prompt_tokens") or 0)
+    inc("llm_completion_tokens_total", usage.get("completion_tokens") or 0)
+
+
+# ---- exposition ------------------------------------------------------------
+
+def _stats_sources() -> dict:
+    # Imported here: these modules import metrics themselves
+    from services import (artifacts, export, history_manager, ingestion, llm_cache, llm_scheduler,
+                          rolling_summary, search, summarizer, text_analysis)
+
+    sources = {
+        "llm_cache": llm_cache.stats,
+        "llm_scheduler": llm_scheduler.stats,
+        "search": search.stats,
+        "summarizer": summarizer.stats,
+        "text_analysis": text_analysis.stats,
+        "rolling_summary": rolling_summary.stats,
+        "artifacts": artifacts.stats,
+        "ingestion_queue": ingestion.queue.stats,
+        "export_queue": export.queue.stats,
+    }
+    if history_manager.cache:
+        sources["history_cache"] = history_manager.cache.stats
+    return sources
+
+
+def _flatten(prefix: str, value, out: list):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else str(key), item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        source, _, stat = prefix.rpartition(".")
+        out.append((source, stat, value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    with _lock:
+        histograms = {key: list(series) for key, series in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for family in sorted({name for name, _ in histograms}):
+        lines += [f"# HELP {PREFIX}{family} {HELP.get(family, family)}", f"# TYPE {PREFIX}{family} histogram"]
+        for (name, labels), series in sorted(histograms.items()):
+            if name != family:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), series):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_format(series[-1])}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+
+    for family in sorted({name for name, _ in counters}):
+        lines += [f"# HELP {PREFIX}{family} {HELP.get(family, family)}", f"# TYPE {PREFIX}{family} counter"]
+        for (name, labels), value in sorted(counters.items()):
+            if name == family:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {_format(value)}")
+
+    stats = []
+    for source, fn in _stats_sources().items():
+        try:
+            _flatten(source, fn(), stats)
+        except Exception as e:
+            print("⚠️ Could not collect stats:", source, e)
+    lines += [f"# HELP {PREFIX}stats {HELP['stats']}", f"# TYPE {PREFIX}stats gauge"]
+    for source, stat, value in stats:
+        lines.append(f"{PREFIX}stats{_labels((('source', source), ('stat', stat)))} {_format(value)}")
+
+    return "\n".join(lines) + "\n"
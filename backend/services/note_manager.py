@@ -1,38 +1,30 @@
-import json
-import os
+from services.storage import read_json, update_json
 
 STORE_PATH = "data/notes.json"
 
 def _load():
-    if not os.path.exists(STORE_PATH):
-        return {}
-    with open(STORE_PATH, "r") as f:
-        return json.load(f)
-
-def _save(data):
-    os.makedirs("data", exist_ok=True)
-    with open(STORE_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+    return read_json(STORE_PATH)[0]
 
 def save_note(user_id: str, note: str):
-    notes = _load()
-    notes.setdefault(user_id, []).append(note)
-    _save(notes)
-    return {"notes": notes[user_id]}
+    def mutate(notes):
+        notes.setdefault(user_id, []).append(note)
+        return notes[user_id]
+    return {"notes": update_json(STORE_PATH, mutate)}
 
 def get_notes(user_id: str):
     notes = _load()
     return {"notes": notes.get(user_id, [])}
 
 def delete_note(user_id: str, index: int):
-    notes = _load()
-    if user_id in notes and 0 <= index < len(notes[user_id]):
-        del notes[user_id][index]
-        _save(notes)
-    return {"notes": notes.get(user_id, [])}
+    def mutate(notes):
+        if user_id in notes and 0 <= index < len(notes[user_id]):
+            del notes[user_id][index]
+        return notes.get(user_id, [])
+    return {"notes": update_json(STORE_PATH, mutate)}
 
 def clear_notes(user_id: str):
-    notes = _load()
-    notes[user_id] = []
-    _save(notes)
+    def mutate(notes):
+        notes[user_id] = []
+        return []
+    update_json(STORE_PATH, mutate)
     return {"notes": []}
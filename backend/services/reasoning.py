@@ -1,79 +1,98 @@
+import asyncio
 import os
-import requests
-from dotenv import load_dotenv
 from collections import Counter
 import re
-from services import search
+from services import search, llm_client, llm_cache, llm_scheduler
+from services.cache import TTLCache, SingleFlight
+from services.tokens import truncate_to_tokens
 import json 
 
-load_dotenv()
+# "parallel" generates and judges all self-correction candidates at once;
+# "sequential" is the original one-round-trip-at-a-time loop
+SELF_CORRECT_MODE = os.getenv("SELF_CORRECT_MODE", "parallel").lower()
+SELF_CORRECT_BUDGET = float(os.getenv("SELF_CORRECT_BUDGET", "60"))  # seconds
 
-API_KEY = os.getenv("NGU_API_KEY")
-BASE_URL = os.getenv("NGU_BASE_URL")
-MODEL = os.getenv("NGU_MODEL")
+# ReAct agent (run_full_react): at most REACT_MAX_STEPS LLM steps, up to
+# REACT_MAX_ACTIONS actions per step run concurrently, observations cached
+# per (tool, input) for REACT_OBSERVATION_TTL seconds across requests
+REACT_MAX_STEPS = int(os.getenv("REACT_MAX_STEPS", "4"))
+REACT_MAX_ACTIONS = int(os.getenv("REACT_MAX_ACTIONS", "4"))
+REACT_OBSERVATION_TTL = float(os.getenv("REACT_OBSERVATION_TTL", "1800"))
+REACT_OBSERVATION_TOKENS = 400  # each observation is cut to this in the prompt
 
-headers = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json"
-}
+_observations = TTLCache(1024, REACT_OBSERVATION_TTL)
+_observation_flights = SingleFlight()
 
 #Prompting LLM for ReAct 
 react_system_message = """
 You are a helpful research assistant using the ReAct (Reasoning + Acting) approach.
 
-You must return exactly one complete reasoning cycle, consisting of:
+Work in steps. In each reply, either:
 1. Thought: What you need to consider
-2. Action: Use one of the following tools - Search[], Clarify[], or Summarize[]
-3. Observation: Show what you found
-4. Final Answer: Conclude based on your observation
+   Action: Tool["input"] - one of Search[], Clarify[], or Summarize[]
+   Then stop. Observations from the actions will be sent back to you.
+   You may list several Action lines when they do not depend on each other; they run in parallel.
+or, once you know enough:
+2. Thought: What the observations show
+   Final Answer: Your conclusion
 
-Only return this exact structure. Do NOT loop. Do NOT repeat the cycle.
-Use one tool. End with a Final Answer.
-
-Only use the above tools. Do not invent tools.
+Never write an Observation yourself. Only use the above tools. Do not invent tools.
 
 Example:
 
-Thought: I should search for benefits of AI in education.
+Thought: I should compare the benefits and the risks of AI in education.
 Action: Search["benefits of AI in education"]
-Observation: AI helps with personalization, grading automation, accessibility...
-Final Answer: The key benefits of AI in education are personalization, automation, and accessibility.
-"""
+Action: Search["risks of AI in education"]
 
-def call_llm(prompt):
-    url = f"{BASE_URL}/chat/completions"
-
-    payload = {
-        "model": MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7
-    }
+(after the observations)
+Thought: The sources agree on personalization and automation, and warn about privacy.
+Final Answer: The key benefits of AI in education are personalization, automation, and accessibility; the main risk is student privacy.
+"""
 
+async def _completion_text(messages, cache_tag=None):
+    """
+    Run one completion, going through the response cache when `cache_tag`
+    is one of the LLM_CACHE_TOOLS (see llm_cache)
+    """
+    key = None
+    if llm_cache.enabled_for(cache_tag):
+        key = llm_cache.make_key(llm_client.MODEL, messages, llm_client.TEMPERATURE)
+        cached = llm_cache.get(key, cache_tag)
+        if cached is not None:
+            return cached
+
+    data = await llm_client.chat_completion(messages)
+    text = data["choices"][0]["message"]["content"]
+    if key:
+        llm_cache.put(key, text)
+    return text
+
+async def call_llm(prompt, cache_tag=None):
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return await _completion_text([{"role": "user", "content": prompt}], cache_tag)
     except Exception as e:
         print(" NGU LLM Error:", e)
         return "Error: Failed to get response from LLM."
 
-def call_llm_with_messages(messages): #for React and context-aware responses
-    url = f"{BASE_URL}/chat/completions"
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": 0.7
-    }
+async def stream_llm_with_messages(messages):
+    """
+    Stream the reply to `messages` as text deltas
+    """
+    try:
+        async for delta in llm_client.stream_chat_completion(messages):
+            yield delta
+    except Exception as e:
+        print("Streaming LLM Error:", e)
+        yield "Error: Failed to get response from LLM."
 
+async def call_llm_with_messages(messages, cache_tag=None): #for React and context-aware responses
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return await _completion_text(messages, cache_tag)
     except Exception as e:
         print("Context-aware LLM Error:", e)
         return "Error: Failed to get response from LLM."
 
-def chain_of_thought_summary(text, format="text"): #backend
+async def chain_of_thought_summary(text, format="text"): #backend
     if format == "JSON":
         prompt = f"Summarize the following text as raw JSON only. Do not include markdown formatting or code blocks. Just output a valid JSON object.\n\n{text}"
     elif format == "bullets":
@@ -81,15 +100,15 @@ def chain_of_thought_summary(text, format="text"): #backend
     else:
         prompt = f"Let's think step by step. Summarize this logically:\n\n{text}"
 
-    return call_llm(prompt)
+    return await call_llm(prompt, cache_tag="summary")
 
-def chain_of_thought_answer(question):  #backend
+async def chain_of_thought_answer(question):  #backend
     prompt = f"Let's think step by step. Answer this question logically:\n{question}"
-    return self_corrected_response(prompt) # self-correction
+    return await self_corrected_response(prompt) # self-correction
 
 
 
-def clarify_concept_enhanced(context_messages):
+def build_clarify_messages(context_messages):
     """
     Enhanced clarification with educational focus - maintains full context
     """
@@ -109,17 +128,19 @@ Be educational and help the user truly understand the concept.
     # Update system message while preserving all context
     enhanced_messages = context_messages.copy()
     enhanced_messages[0]['content'] += clarify_prompt
-    
+    return enhanced_messages
+
+async def clarify_concept_enhanced(context_messages):
     # Use the same context-aware function with enhanced prompt
-    return call_llm_with_messages(enhanced_messages)
+    return await call_llm_with_messages(build_clarify_messages(context_messages))
 
 # FIXED: Use consistent context management
-def respond_with_context(messages):
+async def respond_with_context(messages):
     """
     Respond using properly formatted messages with context
     """
     try:
-        response = call_llm_with_messages(messages)
+        response = await call_llm_with_messages(messages)
         return response
     except Exception as e:
         print("Context-aware LLM Error:", e)
@@ -127,7 +148,48 @@ def respond_with_context(messages):
 
 
 
-def generate_visual_data(text): 
+async def generate_topic_title(conversation_text):
+    """
+    Concise 3-5 word title for a conversation
+    """
+    # Create a focused prompt for topic generation
+    messages = [
+        {
+            "role": "system", 
+            "content": (
+                "You are a topic summarizer. Generate a concise 3-5 word title "
+                "that captures the main research topic or question being discussed. "
+                "Return only the title, no quotes, no extra text."
+            )
+        },
+        {
+            "role": "user", 
+            "content": f"Generate a topic title for this conversation:\n\n{conversation_text}"
+        }
+    ]
+    
+    try:
+        # Titles are cosmetic; they queue behind interactive calls
+        with llm_scheduler.scope(priority=llm_scheduler.BACKGROUND):
+            response = await call_llm_with_messages(messages, cache_tag="topic")
+        
+        # Clean up the response
+        topic = response.strip()
+        topic = topic.replace('"', '').replace("'", "")
+        topic = topic.replace("Title:", "").strip()
+        
+        # Ensure it's not too long
+        if len(topic) > 50:
+            words = topic.split()[:4]  # Take first 4 words
+            topic = " ".join(words)
+        
+        return topic if topic else "Research Discussion"
+        
+    except Exception as e:
+        print(f"Topic generation error: {e}")
+        return "Research Discussion"
+
+async def generate_visual_data(text): 
     """
     Improved function to generate relevant visualization data from research text.
     Just replace your existing function with this one.
@@ -155,7 +217,7 @@ Make sure the labels reflect what's actually in the text, not generic research t
 """
 
     try:
-        raw_output = call_llm(prompt)
+        raw_output = await call_llm(prompt)
         print("LLM raw output:", raw_output)
 
         # Better JSON extraction - try multiple patterns
@@ -204,72 +266,125 @@ Make sure the labels reflect what's actually in the text, not generic research t
         print(f"Error generating visual data: {e}")
         return [{"label": "Processing Error", "count": 1}]
 
-def run_full_react(question):
-    messages = [
-        {"role": "system", "content": react_system_message},
-        {"role": "user", "content": question}
-    ]
-
-    # Step 1: Get initial Thought + Action + Observation structure
-    response = call_llm_with_messages(messages)
-
-    # Step 2: Extract the action
-    action_match = re.search(r"Action:\s*(\w+)\[([^\]]+)\]", response)
-    if not action_match:
-        return response
+_ACTION = re.compile(r"(\w+)\[([^\]]+)\]")
 
-    tool_name = action_match.group(1).strip().lower()
-    input_text = action_match.group(2).strip()
 
+def _parse_actions(response: str) -> list:
+    """
+    (tool, input) pairs from the Action lines of a reply, deduplicated
+    """
+    actions = []
+    for line in response.splitlines():
+        if not line.strip().lower().startswith("action"):
+            continue
+        for tool_name, input_text in _ACTION.findall(line):
+            action = (tool_name.strip().lower(), input_text.strip().strip('"\'').strip())
+            if action[1] and action not in actions:
+                actions.append(action)
+    return actions[:REACT_MAX_ACTIONS]
+
+
+async def _run_action(tool_name: str, input_text: str) -> str:
     if tool_name == "search":
-        tool_result = search.search_web(input_text)
-        
+        tool_result = await search.search_web(input_text)
+
         # Handle different return types from search
         if isinstance(tool_result, str):
             # If search returns a string summary, use it directly
-            obs_text = tool_result
-        elif isinstance(tool_result, list) and tool_result:
+            return tool_result
+        if isinstance(tool_result, list) and tool_result:
             # If search returns a list of dictionaries
-            obs_text = "\n".join(
-                f"- {r.get('title', 'No title')}: {r.get('body', 'No content')[:200]}" 
+            return "\n".join(
+                f"- {r.get('title', 'No title')}: {r.get('body', 'No content')[:200]}"
                 for r in tool_result[:3] if isinstance(r, dict)
             )
-        else:
-            obs_text = "No search results found"
-            
-    elif tool_name == "clarify":
-        obs_text = chain_of_thought_summary(f"Explain this clearly:\n{input_text}")
-    elif tool_name == "summarize":
-        obs_text = chain_of_thought_summary(input_text)
-    else:
-        obs_text = f"Unknown tool: {tool_name}"
+        return "No search results found"
+    if tool_name == "clarify":
+        return await chain_of_thought_summary(f"Explain this clearly:\n{input_text}")
+    if tool_name == "summarize":
+        return await chain_of_thought_summary(input_text)
+    return f"Unknown tool: {tool_name}. Use Search, Clarify or Summarize."
+
 
-    # Step 3: Inject the real observation
-    full_trace = re.sub(
-        r"Observation:.*", f"Observation: {obs_text}", response, flags=re.DOTALL
-    )
+async def _observe(tool_name: str, input_text: str) -> str:
+    """
+    Observation for one action; identical actions (in this run, or in any
+    other within REACT_OBSERVATION_TTL) reuse the same result
+    """
+    key = (tool_name, " ".join(input_text.lower().split()))
+    cached = _observations.get(key)
+    if cached is not None:
+        return cached
 
-    # Step 4: If Final Answer already exists, return trace
-    if "Final Answer:" in full_trace:
-        return full_trace
+    async def run():
+        observation = await _run_action(tool_name, input_text)
+        if not observation.startswith(("Error", "Unknown tool")):
+            _observations.set(key, observation)
+        return observation
 
-    # Step 5: Otherwise, ask LLM for Final Answer
-    followup_prompt = (
-        f"{full_trace}\n\nNow provide a Final Answer based on the above observation."
-    )
-    final_response = call_llm(followup_prompt)
+    # Clarify and summarize actions call the LLM: in-flight observations
+    # are only shared by runs with the same LLM user and priority
+    return await _observation_flights.do(key + llm_scheduler.current(), run)
 
-    # Combine everything
-    return f"{full_trace}\n\nFinal Answer: {final_response.strip()}"
+
+async def run_full_react(question, max_steps=REACT_MAX_STEPS):
+    """
+    ReAct loop: each step the model either requests actions, which run
+    concurrently and are fed back as observations, or gives a Final Answer,
+    which ends the loop. Returns the whole Thought/Action/Observation trace.
+    """
+    messages = [
+        {"role": "system", "content": react_system_message},
+        {"role": "user", "content": question}
+    ]
+    trace = []
+
+    for _ in range(max_steps):
+        response = await call_llm_with_messages(messages)
+        # Anything after an invented Observation was not based on real results
+        response = re.split(r"^\s*Observation:", response, maxsplit=1, flags=re.MULTILINE)[0].strip()
+        actions = _parse_actions(response)
+        if not actions or response.startswith("Error:"):
+            trace.append(response)  # Final Answer, or a plain reply
+            return "\n\n".join(trace)
+
+        observations = await asyncio.gather(*(_observe(tool_name, input_text) for tool_name, input_text in actions))
+        lines = [
+            f"Observation ({tool_name.capitalize()}[\"{input_text}\"]): "
+            f"{truncate_to_tokens(observation, REACT_OBSERVATION_TOKENS)}"
+            for (tool_name, input_text), observation in zip(actions, observations)
+        ]
+        trace.append(response + "\n" + "\n".join(lines))
+        messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "user", "content": "\n".join(lines)})
+
+    # Step budget used up: answer from what has been observed
+    messages.append({"role": "user", "content": "Now provide a Final Answer based on the above observations."})
+    final_response = (await call_llm_with_messages(messages)).strip()
+    trace.append(final_response if "Final Answer:" in final_response else f"Final Answer: {final_response}")
+    return "\n\n".join(trace)
 
 # REMOVED: format_history_as_dialogue 
 
-def self_corrected_response(prompt: str, max_attempts=2):
-    initial = call_llm(prompt)
+def _retry_prompt(prompt: str) -> str:
+    return f"""The previous response was not helpful. Please try again using clearer and more detailed reasoning:\n{prompt}"""
+
+def _evaluation_prompt(answer: str, revised: bool) -> str:
+    if revised:
+        return f"""Evaluate the following revised answer. Is it vague or incomplete? Reply "yes" or "no".\n\nAnswer:\n{answer}"""
+    return f"""Evaluate the following answer. Is it vague, incomplete, or unclear? Reply "yes" or "no".\n\nAnswer:\n{answer}"""
+
+async def self_corrected_response(prompt: str, max_attempts=2, initial=None):
+    # `initial` lets a caller that already streamed the first answer skip that call
+    if SELF_CORRECT_MODE == "parallel":
+        return await self_corrected_response_parallel(prompt, max_attempts + 1, initial)
+
+    if initial is None:
+        initial = await call_llm(prompt)
     print(" Initial answer:\n", initial)
 
-    evaluation_prompt = f"""Evaluate the following answer. Is it vague, incomplete, or unclear? Reply "yes" or "no".\n\nAnswer:\n{initial}"""
-    eval_result = call_llm(evaluation_prompt).strip().lower()
+    evaluation_prompt = _evaluation_prompt(initial, revised=False)
+    eval_result = (await call_llm(evaluation_prompt, cache_tag="evaluate")).strip().lower()
     print("Evaluation result for initial answer:", eval_result)
 
     if "no" in eval_result:
@@ -277,12 +392,11 @@ def self_corrected_response(prompt: str, max_attempts=2):
         return initial
 
     for attempt in range(max_attempts):
-        retry_prompt = f"""The previous response was not helpful. Please try again using clearer and more detailed reasoning:\n{prompt}"""
-        revised = call_llm(retry_prompt)
+        revised = await call_llm(_retry_prompt(prompt))
         print(f"Retry #{attempt+1} revised answer:\n", revised)
 
-        evaluation_prompt = f"""Evaluate the following revised answer. Is it vague or incomplete? Reply "yes" or "no".\n\nAnswer:\n{revised}"""
-        eval_result = call_llm(evaluation_prompt).strip().lower()
+        evaluation_prompt = _evaluation_prompt(revised, revised=True)
+        eval_result = (await call_llm(evaluation_prompt, cache_tag="evaluate")).strip().lower()
         print(" Evaluation result for retry:", eval_result)
 
         if "no" in eval_result:
@@ -290,4 +404,74 @@ def self_corrected_response(prompt: str, max_attempts=2):
             return revised
         
     print(" All retries evaluated as vague. Returning latest retry.")
-    return revised  # fallback to latest if no improvement
\ No newline at end of file
+    return revised  # fallback to latest if no improvement
+
+async def self_corrected_response_parallel(prompt: str, candidates=3, initial=None, budget=None):
+    """
+    Same decision as the sequential loop, in about two round trips: candidate 0
+    answers `prompt` (or is `initial`), candidates 1.. answer the retry prompt,
+    and all are generated and judged concurrently. The lowest-index accepted
+    candidate wins, exactly as if they had been tried in order; if none is
+    accepted the last evaluated one is returned. Outstanding calls are
+    cancelled as soon as the winner is known or the latency budget runs out.
+    """
+    budget = SELF_CORRECT_BUDGET if budget is None else budget
+    drafts = {}
+
+    async def attempt(index):
+        if index == 0:
+            answer = initial if initial is not None else await call_llm(prompt)
+        else:
+            answer = await call_llm(_retry_prompt(prompt))
+        if answer.startswith("Error:"):
+            raise RuntimeError(answer)
+        drafts[index] = answer
+        verdict = await call_llm(_evaluation_prompt(answer, revised=index > 0), cache_tag="evaluate")
+        if verdict.startswith("Error:"):
+            raise RuntimeError(verdict)  # left unevaluated, not judged vague
+        return "no" in verdict.strip().lower()
+
+    tasks = {asyncio.create_task(attempt(i)): i for i in range(candidates)}
+    verdicts = {}  # index -> True (accepted), False (judged vague), None (generation or evaluation failed)
+    deadline = asyncio.get_running_loop().time() + budget
+    pending = set(tasks)
+    winner = None
+    try:
+        while pending and winner is None:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    verdicts[tasks[task]] = task.result()
+                except Exception:
+                    verdicts[tasks[task]] = None
+
+            # Decide in candidate order: stop at the first accepted one, but
+            # only once every earlier candidate is rejected or failed
+            for i in range(candidates):
+                if i not in verdicts:
+                    break
+                if verdicts[i]:
+                    winner = i
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if winner is not None:
+        return drafts[winner]
+
+    # Nothing accepted in order (all vague or failed, or out of time):
+    # an accepted later draft, else the latest judged one as the sequential
+    # loop would return, else an unevaluated one
+    accepted = sorted(i for i, ok in verdicts.items() if ok)
+    if accepted:
+        return drafts[accepted[0]]
+    judged = sorted(i for i, ok in verdicts.items() if ok is False)
+    if judged:
+        return drafts[judged[-1]]
+    if drafts:
+        return drafts[min(drafts)]
+    return "Error: Failed to get response from LLM."
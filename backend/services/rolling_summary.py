@@ -0,0 +1,192 @@
+# rolling_summary.py - per-user conversation summary kept up to date as messages arrive
+
+"""
+Instead of rescanning the whole history for topics on every call, each
+user's summary state is updated incrementally by history_manager as
+messages are appended:
+
+  topic    - key words of the latest substantial user message
+  topics   - key terms of the first three substantial user messages
+  summary  - LLM-written summary of messages [0, upto)
+
+Every ROLLING_SUMMARY_EVERY new messages the LLM summary is refreshed in
+the background from the previous summary plus the new messages only, and
+stored alongside the history (history_store get_summary/set_summary), so
+it survives restarts. ContextManager injects it as a system message once
+older turns no longer fit in the prompt.
+
+State for up to ROLLING_SUMMARY_USERS users is kept in memory; other users,
+and users whose stored history was changed by another worker process, are
+rebuilt from their history the next time they are needed.
+"""
+
+import asyncio
+import os
+
+from services.cache import TTLCache
+from services.history_store import get_store
+from services.messages import Message
+from services.text_analysis import analyze
+from services.tokens import truncate_to_tokens
+
+ROLLING_SUMMARY_EVERY = int(os.getenv("ROLLING_SUMMARY_EVERY", "6"))
+ROLLING_SUMMARY_USERS = int(os.getenv("ROLLING_SUMMARY_USERS", "1024"))
+# Each new message is cut to this many tokens in the refresh prompt
+ROLLING_SUMMARY_MESSAGE_TOKENS = 300
+
+_states = TTLCache(ROLLING_SUMMARY_USERS)
+_refreshing: set = set()
+_tasks: set = set()
+_epochs: dict = {}  # user_id -> bumped on reset, so stale refreshes are dropped
+_loop = None  # the app's event loop; appends also arrive from worker threads
+
+
+def _new_state() -> dict:
+    return {"count": 0, "last": "", "topic": "", "topics": [], "summary": "", "upto": 0}
+
+
+def _apply(state: dict, message: Message):
+    if message.role == "user":
+        analysis = analyze(message.content)
+        if analysis.word_count > 3 and analysis.topic:
+            state["topic"] = analysis.topic
+        if analysis.word_count > 3 and analysis.key_terms and len(state["topics"]) < 3:
+            state["topics"].append(analysis.key_terms)
+    state["count"] += 1
+    state["last"] = message.hash
+
+
+def _load(user_id: str) -> dict:
+    from services import history_manager
+
+    history = history_manager.get_history(user_id)
+    state = _new_state()
+    for message in history:
+        _apply(state, message)
+    try:
+        saved = get_store().get_summary(user_id)
+    except Exception as e:
+        print("⚠️ Failed to load conversation summary:", e)
+        saved = None
+    # The summary only applies if the messages it covers are still there
+    upto = saved.get("upto", 0) if saved else 0
+    if saved and 0 < upto <= len(history) and history[upto - 1].hash == saved.get("hash"):
+        state["summary"] = saved.get("summary", "")
+        state["upto"] = upto
+    _states.set(user_id, state)
+    return state
+
+
+def get_state(user_id: str) -> dict:
+    """
+    Summary state of the user's conversation; the history is only scanned
+    the first time a user is seen (or after eviction), or when the stored
+    history no longer ends where the state does (appended to or cleared
+    by another worker process)
+    """
+    from services import history_manager
+
+    state = _states.get(user_id)
+    if state is not None:
+        count, last = history_manager.latest(user_id)
+        if count != state["count"] or (last is not None and last.hash != state["last"]):
+            state = None
+    if state is None:
+        state = _load(user_id)
+    return state
+
+
+def observe(user_id: str, message: Message):
+    """
+    Account for one appended message (called by history_manager)
+    """
+    state = _states.get(user_id)
+    if state is None:
+        return  # loaded from history when first needed
+    _apply(state, message)
+    if state["count"] - state["upto"] >= ROLLING_SUMMARY_EVERY:
+        _schedule_refresh(user_id)
+
+
+def reset(user_id: str):
+    _epochs[user_id] = _epochs.get(user_id, 0) + 1
+    _states.set(user_id, _new_state())
+    try:
+        get_store().set_summary(user_id, None)
+    except Exception as e:
+        print("⚠️ Failed to delete conversation summary:", e)
+
+
+def bind_loop(loop):
+    """
+    Run refreshes on `loop`, also for messages appended from worker threads
+    (called by history_manager.start)
+    """
+    global _loop
+    _loop = loop
+
+
+def _schedule_refresh(user_id: str):
+    if user_id in _refreshing:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = _loop
+    if loop is None or loop.is_closed():
+        return  # no event loop (scripts); the next append from a request retries
+    _refreshing.add(user_id)
+    loop.call_soon_threadsafe(_start_refresh, user_id)
+
+
+def _start_refresh(user_id: str):
+    task = asyncio.get_running_loop().create_task(_refresh(user_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _refresh_prompt(summary: str, messages: list) -> str:
+    lines = [
+        f"{message.role.capitalize()}: {truncate_to_tokens(message.content, ROLLING_SUMMARY_MESSAGE_TOKENS)}"
+        for message in messages
+    ]
+    return (
+        "Update the running summary of a research conversation. Keep it under 150 words "
+        "and keep the topics, findings, decisions and open questions that matter for "
+        "follow-up questions.\n\n"
+        f"Current summary:\n{summary or '(none yet)'}\n\n"
+        "New messages:\n" + "\n".join(lines) + "\n\nReturn only the updated summary."
+    )
+
+
+async def _refresh(user_id: str):
+    from services import history_manager, llm_scheduler, reasoning  # imported here: history_manager imports this module
+
+    epoch = _epochs.get(user_id, 0)
+    try:
+        state = _states.get(user_id)
+        if state is None:
+            return
+        history = await asyncio.to_thread(history_manager.get_history, user_id)
+        upto = len(history)
+        if upto <= state["upto"]:
+            return
+        # A long backlog (e.g. a history from before summaries existed) is
+        # summarized from its most recent messages only
+        start = max(state["upto"], upto - 4 * ROLLING_SUMMARY_EVERY)
+        with llm_scheduler.scope(user_id, llm_scheduler.BACKGROUND):
+            summary = await reasoning.call_llm(_refresh_prompt(state["summary"], history[start:upto]))
+        if summary.startswith("Error:") or _epochs.get(user_id, 0) != epoch:
+            return
+        state["summary"] = summary.strip()
+        state["upto"] = upto
+        await asyncio.to_thread(get_store().set_summary, user_id,
+                                {"summary": state["summary"], "upto": upto, "hash": history[upto - 1].hash})
+    except Exception as e:
+        print("⚠️ Conversation summary refresh failed:", e)
+    finally:
+        _refreshing.discard(user_id)
+
+
+def stats() -> dict:
+    return {"users": _states.stats(), "refreshing": len(_refreshing)}
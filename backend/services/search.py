@@ -1,56 +1,280 @@
 # search.py - FIXED VERSION
 
+"""
+Web search with a pluggable provider, TTL caches and request coalescing.
+
+- The provider is DuckDuckGo by default. set_search_provider() swaps it
+  (tests, benchmarks), as does SEARCH_PROVIDER="package.module:attribute".
+- Raw results are cached per normalized query for SEARCH_CACHE_TTL seconds.
+- Summaries are cached per (normalized query, context summary) for
+  SEARCH_SUMMARY_TTL seconds.
+- Concurrent identical queries share one upstream request (single-flight),
+  which also keeps the ReAct agent and several users from tripping
+  DuckDuckGo's rate limit together.
+- With fan_out > 1 a query is expanded into variants that are searched
+  concurrently (at most SEARCH_CONCURRENCY at a time), deduplicated by URL
+  and near-duplicate body, ranked, and summarized once.
+"""
+
+import asyncio
+import importlib
+import os
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
 from duckduckgo_search import DDGS
-from services import reasoning  # make sure this is imported
+from services import llm_scheduler, metrics, reasoning  # make sure this is imported
+from services.cache import TTLCache, SingleFlight
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_SUMMARY_TTL = float(os.getenv("SEARCH_SUMMARY_TTL", "1800"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_FANOUT = int(os.getenv("SEARCH_FANOUT", "3"))  # variants used by the search tool
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "3"))
+SEARCH_EXPAND_WITH_LLM = os.getenv("SEARCH_EXPAND_WITH_LLM", "0") == "1"
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_results_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+_summary_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_SUMMARY_TTL)
+_flights = SingleFlight()
+_provider_slots = None  # asyncio.Semaphore, created lazily inside the event loop
 
-def search_web(query: str, summarize: bool = True, context_summary: str = ""):
+
+class DuckDuckGoProvider:
     """
-    Enhanced search with context awareness
+    Default provider. DDGS is blocking, so it runs in a worker thread.
     """
-    try:
+
+    def _text(self, query: str, max_results: int):
         with DDGS() as ddgs:
-            results = ddgs.text(query, max_results=5)
-            if not results or all('title' not in r for r in results):
-                return [{
-                    "title": "Search Error",
-                    "href": "",
-                    "body": "DuckDuckGo returned no results. You may have hit a rate limit or provided too long of a query."
-                }]
-
-            cleaned_results = [
-                {
-                    "title": r.get("title", "No Title"),
-                    "href": r.get("href", ""),
-                    "body": r.get("body", "")
-                }
-                for r in results if "title" in r
-            ]
-
-            if summarize:
-                combined_text = "\n".join(f"{r['title']}: {r['body']}" for r in cleaned_results)
+            return ddgs.text(query, max_results=max_results)
+
+    async def text(self, query: str, max_results: int = 5) -> list:
+        return await asyncio.to_thread(self._text, query, max_results)
+
+
+def _load_provider(spec: str):
+    if spec in ("", "duckduckgo"):
+        return DuckDuckGoProvider()
+    module_name, _, attr = spec.partition(":")
+    provider = getattr(importlib.import_module(module_name), attr)
+    return provider() if isinstance(provider, type) else provider
+
+
+_provider = _load_provider(os.getenv("SEARCH_PROVIDER", "duckduckgo"))
+
+
+def set_search_provider(provider):
+    """
+    Replace the search backend. `provider` needs an async
+    text(query, max_results) returning DuckDuckGo-style dicts.
+    Clears the caches so results from the old provider are not served.
+    """
+    global _provider
+    _provider = provider
+    _results_cache.clear()
+    _summary_cache.clear()
+
+
+def get_search_provider():
+    return _provider
+
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+async def fetch_results(query: str, max_results: int = 5) -> list:
+    """
+    Cleaned {title, href, body} results for `query`, from cache when possible.
+    Provider errors propagate to the caller.
+    """
+    key = (_normalize_query(query), max_results)
+    cached = _results_cache.get(key)
+    if cached is not None:
+        return list(cached)
+
+    async def fetch():
+        with metrics.span("search_provider"):
+            results = await _provider.text(query, max_results=max_results)
+        cleaned = [
+            {
+                "title": r.get("title", "No Title"),
+                "href": r.get("href", ""),
+                "body": r.get("body", "")
+            }
+            for r in (results or []) if "title" in r
+        ]
+        if cleaned:  # never cache an empty / rate-limited response
+            _results_cache.set(key, cleaned)
+        return cleaned
+
+    return list(await _flights.do(("results",) + key, fetch))
+
+
+async def summarize_results(query: str, cleaned_results: list, context_summary: str = "") -> str:
+    key = (_normalize_query(query), context_summary, tuple(r["href"] for r in cleaned_results))
+    cached = _summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def summarize():
+        combined_text = "\n".join(f"{r['title']}: {r['body']}" for r in cleaned_results)
+
+        # Enhanced summary prompt with context awareness
+        if context_summary:
+            summary_prompt = f"""Based on the following search results, provide an insightful overview that answers the query: "{query}". 
                 
-                # Enhanced summary prompt with context awareness
-                if context_summary:
-                    summary_prompt = f"""Based on the following search results, provide an insightful overview that answers the query: "{query}". 
-                    
 Context from our conversation: {context_summary}
 
 Connect the search results to our ongoing discussion when relevant. Be concise and clear.
 
 Search results:
 {combined_text}"""
-                else:
-                    summary_prompt = f"""Based on the following search results, provide an insightful overview or conclusion that answers the query: "{query}". Be concise and clear.
+        else:
+            summary_prompt = f"""Based on the following search results, provide an insightful overview or conclusion that answers the query: "{query}". Be concise and clear.
 
 {combined_text}"""
 
-                summary = reasoning.call_llm(summary_prompt)
-                formatted_results = "\n".join(
-                    f"• {r['title']}\n  {r['href']}" for r in cleaned_results
-                )
-                return f"🧠 Summary:\n{summary}\n\n🔗 Sources:\n{formatted_results}"
+        summary = await reasoning.call_llm(summary_prompt)
+        if not summary.startswith("Error:"):
+            _summary_cache.set(key, summary)
+        return summary
+
+    # Results are cached for everyone, but only callers with the same LLM
+    # user and priority share an in-flight summary call
+    return await _flights.do(("summary",) + key + llm_scheduler.current(), summarize)
 
-            return cleaned_results
+
+def expand_query(query: str, topic: str = "", context_summary: str = "", limit: int = SEARCH_FANOUT) -> list:
+    """
+    Cheap query variants from the conversation topic and summary
+    (see ContextManager._extract_current_topic / get_conversation_summary).
+    Only variants that add words not already searched for are kept, so
+    without such context this is just [query] and no extra searches run.
+    """
+    variants = [query.strip()]
+    covered = set(_normalize_query(query).split())
+
+    candidates = []
+    if topic:
+        candidates.append(topic)
+    if context_summary.startswith("Discussing: "):
+        candidates.extend(t.strip() for t in context_summary[len("Discussing: "):].split(","))
+    for extra in candidates:
+        new_words = list(dict.fromkeys(w for w in _normalize_query(extra).split() if w not in covered))
+        if new_words:
+            variants.append(f"{query.strip()} {' '.join(new_words)}")
+            covered.update(new_words)
+    return variants[:limit]
+
+
+async def expand_query_llm(query: str, context_summary: str = "", limit: int = SEARCH_FANOUT) -> list:
+    prompt = (
+        f"Write {limit - 1} alternative web search queries for: \"{query}\".\n"
+        + (f"Conversation context: {context_summary}\n" if context_summary else "")
+        + "Return one query per line, no numbering, no extra text."
+    )
+    reply = await reasoning.call_llm(prompt, cache_tag="search_expand")
+    if reply.startswith("Error:"):
+        return [query]
+    lines = [re.sub(r"^[\s\-\d\.\)\"]+|\"$", "", line).strip() for line in reply.splitlines()]
+    return [query] + [line for line in lines if line][: limit - 1]
+
+
+def _normalize_url(url: str) -> str:
+    # Dedup key: no scheme, "www.", fragment, trailing slash or utm_* parameters
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith("utm_")])
+    return host + parts.path.rstrip("/") + (f"?{query}" if query else "")
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def merge_results(result_lists: list, max_results: int = 5) -> list:
+    """
+    Dedupe hits from several variant searches and rank them by reciprocal
+    rank fusion, so results found by several variants, and found early, win.
+    """
+    merged = []  # [score, result, shingles]
+    by_url = {}
+    for results in result_lists:
+        for rank, r in enumerate(results):
+            score = 1.0 / (rank + 1)
+            url = _normalize_url(r["href"])
+            if url and url in by_url:
+                by_url[url][0] += score
+                continue
+
+            shingles = _shingles(r["body"] or r["title"])
+            duplicate = None
+            for entry in merged:
+                union = len(shingles | entry[2])
+                if union and len(shingles & entry[2]) / union >= NEAR_DUPLICATE_THRESHOLD:
+                    duplicate = entry
+                    break
+            if duplicate:
+                duplicate[0] += score
+                continue
+
+            entry = [score, r, shingles]
+            merged.append(entry)
+            if url:
+                by_url[url] = entry
+
+    merged.sort(key=lambda e: e[0], reverse=True)
+    return [entry[1] for entry in merged[:max_results]]
+
+
+async def fetch_results_fanout(variants: list, max_results: int = 5) -> list:
+    global _provider_slots
+    if _provider_slots is None:
+        _provider_slots = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+    async def one(variant):
+        async with _provider_slots:
+            return await fetch_results(variant, max_results)
+
+    outcomes = await asyncio.gather(*(one(v) for v in variants), return_exceptions=True)
+    result_lists = [o for o in outcomes if isinstance(o, list)]
+    if not result_lists:
+        # every variant failed; surface the first error like a single search would
+        raise next(o for o in outcomes if isinstance(o, BaseException))
+    return merge_results(result_lists, max_results)
+
+
+async def search_web(query: str, summarize: bool = True, context_summary: str = "", topic: str = "", fan_out: int = 1):
+    """
+    Enhanced search with context awareness.
+    fan_out > 1 searches that many query variants concurrently and merges them.
+    """
+    try:
+        if fan_out > 1:
+            if SEARCH_EXPAND_WITH_LLM:
+                variants = await expand_query_llm(query, context_summary, fan_out)
+            else:
+                variants = expand_query(query, topic, context_summary, fan_out)
+            cleaned_results = await fetch_results_fanout(variants)
+        else:
+            cleaned_results = await fetch_results(query)
+        if not cleaned_results:
+            return [{
+                "title": "Search Error",
+                "href": "",
+                "body": "DuckDuckGo returned no results. You may have hit a rate limit or provided too long of a query."
+            }]
+
+        if summarize:
+            summary = await summarize_results(query, cleaned_results, context_summary)
+            formatted_results = "\n".join(
+                f"• {r['title']}\n  {r['href']}" for r in cleaned_results
+            )
+            return f"🧠 Summary:\n{summary}\n\n🔗 Sources:\n{formatted_results}"
+
+        return cleaned_results
 
     except Exception as e:
         print("⚠️ DuckDuckGo error:", e)
@@ -58,4 +282,12 @@ Search results:
             "title": "DuckDuckGo Search Error",
             "href": "",
             "body": "DuckDuckGo request failed. This may be due to rate limits or network error."
-        }]
\ No newline at end of file
+        }]
+
+
+def stats() -> dict:
+    return {
+        "results": _results_cache.stats(),
+        "summaries": _summary_cache.stats(),
+        "coalesced": _flights.shared,
+    }
@@ -0,0 +1,23 @@
+# sse.py - Server-Sent Events helpers for the streaming endpoints
+
+import json
+from fastapi.responses import StreamingResponse
+
+
+def format_event(event: dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """
+    Wrap an async iterator of event dicts as a text/event-stream response
+    """
+    async def body():
+        async for event in events:
+            yield format_event(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
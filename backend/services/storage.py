@@ -0,0 +1,131 @@
+# storage.py - locking and atomic commits shared by the file-backed stores
+
+"""
+Concurrency-safe file storage helpers.
+
+- file_lock(path): exclusive lock that holds across threads and across
+  uvicorn worker processes (fcntl on POSIX, msvcrt on Windows)
+- atomic_write_json(path, data): temp file + fsync + os.replace, so readers
+  only ever see the old or the new file, never a truncated one
+- update_json(path, mutate): optimistic read-modify-write. The file is read
+  without the lock, mutated, and committed only if its version (inode, mtime,
+  size) is unchanged; conflicts are retried, then finished under the lock.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+OPTIMISTIC_RETRIES = 5
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.RLock:
+    key = os.path.abspath(path)
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on `path` (via a sibling .lock file)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _thread_lock(path):
+        with open(f"{path}.lock", "a+") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_version(path: str):
+    """
+    Cheap version token for a file; changes on every atomic commit
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def atomic_write_json(path: str, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_json(path: str, default=None):
+    """
+    Return (data, version). A missing file reads as `default`.
+    """
+    while True:
+        version = file_version(path)
+        if version is None:
+            return ({} if default is None else default), None
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            continue
+        # If a commit landed between stat and read, the version would be
+        # wrong for this data; read again so the pair stays consistent
+        if file_version(path) == version:
+            return data, version
+
+
+def update_json(path: str, mutate, default=None):
+    """
+    Apply `mutate(data)` to the JSON document at `path` and commit it.
+    `mutate` may run more than once, so it must only touch `data`.
+    Returns whatever `mutate` returns.
+    """
+    for _ in range(OPTIMISTIC_RETRIES):
+        data, version = read_json(path, default)
+        result = mutate(data)
+        with file_lock(path):
+            if file_version(path) != version:
+                continue  # someone committed first, redo against their data
+            atomic_write_json(path, data)
+            return result
+
+    # Heavy contention: stop racing and do the whole cycle under the lock
+    with file_lock(path):
+        data, _ = read_json(path, default)
+        result = mutate(data)
+        atomic_write_json(path, data)
+        return result
@@ -0,0 +1,132 @@
+# summarizer.py - map-reduce summarization for long documents
+
+"""
+Long text is split into token-bounded chunks (SUMMARY_CHUNK_TOKENS), the
+chunks are summarized concurrently (at most SUMMARY_CONCURRENCY LLM calls at
+once), and the chunk summaries are reduced the same way until they fit in a
+single prompt. Chunk summaries are cached by content hash, so summarizing
+the same document again only pays for the final pass, if that.
+
+If any chunk cannot be summarized, condense() raises SummaryError rather
+than reducing an incomplete set of summaries; summarize_document() turns
+that into an "Error: ..." reply, which callers never cache.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+
+from services import reasoning
+from services.cache import TTLCache
+from services.tokens import count_tokens
+
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_LEVELS = 4
+
+_chunk_cache = TTLCache(int(os.getenv("SUMMARY_CACHE_SIZE", "4096")))
+_slots = None  # asyncio.Semaphore, created lazily inside the event loop
+
+
+class SummaryError(Exception):
+    """
+    A chunk summary failed, so the document cannot be summarized completely
+    """
+
+
+def chunk_text(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list:
+    """
+    Pack paragraphs into chunks of at most max_tokens, splitting paragraphs
+    that are too long on their own by words
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        current, current_tokens = [], 0
+        for word in paragraph.split():
+            current.append(word)
+            current_tokens += count_tokens(word + " ")
+            if current_tokens >= max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+        if current:
+            pieces.append(" ".join(current))
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+async def _summarize_chunk(chunk: str) -> str:
+    global _slots
+    key = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    cached = _chunk_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    async with _slots:
+        summary = await reasoning.call_llm(
+            "Summarize this section of a longer document. Keep every key fact, "
+            f"figure, name and conclusion; be concise:\n\n{chunk}"
+        )
+    if summary.startswith("Error:"):
+        raise SummaryError(summary)
+    _chunk_cache.set(key, summary)
+    return summary
+
+
+async def condense(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS, on_progress=None) -> str:
+    """
+    Map-reduce `text` down to at most about max_tokens. Text that already
+    fits is returned unchanged. on_progress(level, done, total) is called as
+    chunk summaries finish. Raises SummaryError if any chunk fails.
+    """
+    for level in range(SUMMARY_MAX_LEVELS):
+        if count_tokens(text) <= max_tokens:
+            return text
+        chunks = chunk_text(text, max_tokens)
+        done = 0
+
+        async def run(chunk):
+            nonlocal done
+            summary = await _summarize_chunk(chunk)
+            done += 1
+            if on_progress:
+                on_progress(level, done, len(chunks))
+            return summary
+
+        summaries = await asyncio.gather(*(run(c) for c in chunks))
+        text = "\n\n".join(summaries)
+    return text
+
+
+async def summarize_document(text: str, format: str = "text", on_progress=None) -> str:
+    """
+    Summarize a whole document of any length in the requested format
+    """
+    try:
+        condensed = await condense(text, on_progress=on_progress)
+    except SummaryError as e:
+        print("⚠️ Document summary failed:", e)
+        return "Error: Failed to summarize part of the document."
+    return await reasoning.chain_of_thought_summary(condensed, format)
+
+
+def stats() -> dict:
+    return _chunk_cache.stats()
@@ -0,0 +1,82 @@
+# text_analysis.py - shared word/keyword analysis of chat messages
+
+"""
+The keyword heuristics ContextManager (and rolling_summary) apply to
+messages: stopword filtering, key terms, topic detection and the term sets
+used for relevance scoring.
+
+Stopwords are frozensets and patterns are compiled once at import.
+analyze() is memoized per message text, so a history message is analyzed
+once and every later turn is a cache lookup.
+"""
+
+import re
+from functools import lru_cache
+from typing import FrozenSet, NamedTuple
+
+# Words dropped when naming the topic of a user message
+TOPIC_STOPWORDS = frozenset({
+    'what', 'how', 'why', 'is', 'are', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at',
+    'to', 'for', 'of', 'with', 'by', 'about', 'can', 'could', 'would', 'should', 'tell', 'me',
+    'you', 'i', 'we', 'they',
+})
+
+# Words that never count as key terms
+KEY_TERM_STOPWORDS = frozenset({
+    'what', 'how', 'why', 'when', 'where', 'would', 'could', 'should', 'about', 'explain', 'tell',
+})
+
+# Phrases that mark a user message as asking about a topic
+_TOPIC_CUE = re.compile(r"about|explain|what|how|why|tell me")
+_NON_ALPHA = re.compile(r"[^a-zA-Z]")
+_TERM = re.compile(r"[a-z0-9]{4,}")
+
+ANALYSIS_CACHE_SIZE = 16384
+
+
+class Analysis(NamedTuple):
+    word_count: int
+    topic: str                # first 4 non-stopwords
+    key_terms: str            # first 2 key terms
+    terms: FrozenSet[str]     # words of 4+ letters/digits, for overlap scoring
+    establishes_topic: bool   # a substantial question or topic statement
+
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def analyze(text: str) -> Analysis:
+    stripped = text.strip()
+    lowered = stripped.lower()
+    words = lowered.split()
+
+    topic_words = [w for w in words if w not in TOPIC_STOPWORDS][:4]
+
+    key_terms = []
+    for word in words:
+        word = _NON_ALPHA.sub('', word)  # Remove punctuation
+        if len(word) > 3 and word not in KEY_TERM_STOPWORDS:
+            key_terms.append(word)
+            if len(key_terms) == 2:
+                break
+
+    establishes_topic = len(words) > 3 and (
+        stripped.endswith('?') or _TOPIC_CUE.search(lowered) is not None or len(stripped) > 20
+    )
+
+    return Analysis(
+        word_count=len(words),
+        topic=' '.join(topic_words),
+        key_terms=' '.join(key_terms),
+        terms=frozenset(_TERM.findall(lowered)),
+        establishes_topic=establishes_topic,
+    )
+
+
+def stats() -> dict:
+    info = analyze.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "entries": info.currsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,53 @@
+# tokens.py - fast token counting for prompt budgeting
+
+"""
+TOKENIZER picks how tokens are counted:
+  - "estimate" (default): ~4 characters per token, no dependencies
+  - "tiktoken": exact cl100k_base counts if tiktoken is installed and its
+    encoding can be loaded; falls back to the estimate otherwise
+The model behind NGU_BASE_URL is not an OpenAI model, so both are
+approximations; they only need to be good enough to keep prompts in budget.
+"""
+
+import math
+import os
+from functools import lru_cache
+
+TOKENIZER = os.getenv("TOKENIZER", "estimate").lower()
+
+_encoding = None
+if TOKENIZER == "tiktoken":
+    try:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print("⚠️ tiktoken unavailable, estimating token counts:", e)
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+@lru_cache(maxsize=16384)
+def cached_count_tokens(text: str) -> int:
+    """
+    count_tokens memoized per message; history messages are counted once
+    and then looked up on every later turn
+    """
+    return count_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep the head and tail of `text` within about max_tokens
+    """
+    if cached_count_tokens(text) <= max_tokens:
+        return text
+    marker = "\n[...]\n"
+    keep_chars = max(max_tokens * len(text) // max(cached_count_tokens(text), 1) - len(marker), 0)
+    head = keep_chars * 2 // 3
+    return text[:head] + marker + text[len(text) - (keep_chars - head):]
@@ -1,67 +1,139 @@
 # tool_manager.py - FIXED VERSION
 
+import asyncio
+from services import metrics
 from services import reasoning
 from services import search
 from services import export
+from services import summarizer
 
-def run_tool_with_context(tool_name: str, input_text: str, context_messages: list, history: list = None):
+# Tools whose reply can be streamed token by token (see stream_tool_with_context)
+STREAMING_TOOLS = {"summarize", "clarify", "qa"}
+
+SUMMARIZE_FAILED = "Error: Failed to summarize part of the input."
+
+def _prepare_summarize_messages(input_text: str, context_messages: list, history: list = None):
+    # FIXED: Always use context management for summarize
+    lowered = input_text.lower()
+    
+    # If no actual content provided, use last assistant message
+    if len(input_text.strip()) < 10 and history:
+        last_assistant = [msg.content for msg in history if msg.role == "assistant"]
+        if last_assistant:
+            input_text = last_assistant[-1]  # Most recent assistant message
+            # Update the context messages with the new input
+            context_messages[-1]['content'] = input_text
+    
+    # Modify system message based on format request
+    if "bullet" in lowered:
+        # Update system message for bullet format
+        context_messages[0]['content'] += "\n\nProvide your summary using concise bullet points."
+    elif "json" in lowered or "structured" in lowered or "machine readable" in lowered:
+        # Update system message for JSON format  
+        context_messages[0]['content'] += "\n\nProvide your summary as raw JSON only. Do not include markdown formatting or code blocks. Just output a valid JSON object."
+    else:
+        # Default summary format with context
+        context_messages[0]['content'] += "\n\nProvide a clear, well-structured summary using the conversation context."
+    
+    return context_messages
+
+async def _summarize_messages(input_text: str, context_messages: list, history: list = None):
+    messages = _prepare_summarize_messages(input_text, context_messages, history)
+    # Long input is map-reduced to chunk summaries first, so the final
+    # summary covers all of it within one prompt
+    messages[-1]['content'] = await summarizer.condense(messages[-1]['content'])
+    return messages
+
+def _qa_prompt(initial_response: str) -> str:
+    return f"The following is a draft response. Improve it if it is vague or unclear:\n\n{initial_response}"
+
+async def run_tool_with_context(tool_name: str, input_text: str, context_messages: list, history: list = None, user_id: str = None):
     """
     Context-aware tool execution with enhanced search handling
     """
+    with metrics.span("tool", tool=tool_name):
+        return await _run_tool(tool_name, input_text, context_messages, history, user_id)
+
+async def _run_tool(tool_name: str, input_text: str, context_messages: list, history: list = None, user_id: str = None):
     if tool_name == "summarize":
-        # FIXED: Always use context management for summarize
-        lowered = input_text.lower()
-        
-        # If no actual content provided, use last assistant message
-        if len(input_text.strip()) < 10 and history:
-            last_assistant = [msg for i, msg in enumerate(history) if i % 2 == 1]
-            if last_assistant:
-                input_text = last_assistant[-1]  # Most recent assistant message
-                # Update the context messages with the new input
-                context_messages[-1]['content'] = input_text
-        
-        # Modify system message based on format request
-        if "bullet" in lowered:
-            # Update system message for bullet format
-            context_messages[0]['content'] += "\n\nProvide your summary using concise bullet points."
-        elif "json" in lowered or "structured" in lowered or "machine readable" in lowered:
-            # Update system message for JSON format  
-            context_messages[0]['content'] += "\n\nProvide your summary as raw JSON only. Do not include markdown formatting or code blocks. Just output a valid JSON object."
-        else:
-            # Default summary format with context
-            context_messages[0]['content'] += "\n\nProvide a clear, well-structured summary using the conversation context."
-        
+        try:
+            context_messages = await _summarize_messages(input_text, context_messages, history)
+        except summarizer.SummaryError:
+            return SUMMARIZE_FAILED
         # Always use context-aware response
-        return reasoning.respond_with_context(context_messages)
+        return await reasoning.respond_with_context(context_messages)
 
     elif tool_name == "qa":
-         initial_response = reasoning.respond_with_context(context_messages)
-         return reasoning.self_corrected_response(f"The following is a draft response. Improve it if it is vague or unclear:\n\n{initial_response}")
+         initial_response = await reasoning.respond_with_context(context_messages)
+         return await reasoning.self_corrected_response(_qa_prompt(initial_response))
     
     elif tool_name == "search":
         # FIXED: Enhanced search with conversation context
         context_summary = ""
+        topic = ""
         if history and len(history) > 0:
             # Extract context for search
             from services.context_manager import ContextManager
             context_mgr = ContextManager()
-            context_summary = context_mgr.get_conversation_summary(history)
+            context_summary = context_mgr.get_conversation_summary(history, user_id)
+            topic = context_mgr._extract_current_topic(history, user_id)
         
-        return search.search_web(input_text, summarize=True, context_summary=context_summary)
+        return await search.search_web(input_text, summarize=True, context_summary=context_summary,
+                                       topic=topic, fan_out=search.SEARCH_FANOUT)
 
     elif tool_name == "clarify":
         
-        return reasoning.clarify_concept_enhanced(context_messages)
+        return await reasoning.clarify_concept_enhanced(context_messages)
 
     elif tool_name == "visualize":
-        return reasoning.generate_visual_data(input_text)
+        return await reasoning.generate_visual_data(input_text)
 
     elif tool_name == "react_agent":
-        return reasoning.run_full_react(input_text)
+        return await reasoning.run_full_react(input_text)
+
+    elif tool_name == "generate_topic":
+        # Title for the given text, or for the latest part of the conversation
+        text = input_text.strip() or "\n".join(f"{m.role}: {m.content}" for m in (history or [])[-10:])
+        if not text:
+            return "New Conversation"
+        return await reasoning.generate_topic_title(text)
 
     elif tool_name == "export_pdf":
-        path = export.generate_pdf(input_text)
+        path = await asyncio.to_thread(export.generate_pdf, input_text)
         return {"file_path": path}
 
     else:
-        return {"error": "Invalid tool name"}
\ No newline at end of file
+        return {"error": "Invalid tool name"}
+
+async def stream_tool_with_context(tool_name: str, input_text: str, context_messages: list, history: list = None):
+    """
+    Streaming counterpart of run_tool_with_context for STREAMING_TOOLS.
+    Yields {"type": "delta", "content": ...} events; qa may finish with a
+    {"type": "replace", "content": ...} event if self-correction rejects the
+    streamed answer and a revised one replaces it.
+    """
+    if tool_name == "summarize":
+        try:
+            messages = await _summarize_messages(input_text, context_messages, history)
+        except summarizer.SummaryError:
+            yield {"type": "delta", "content": SUMMARIZE_FAILED}
+            return
+    elif tool_name == "clarify":
+        messages = reasoning.build_clarify_messages(context_messages)
+    elif tool_name == "qa":
+        initial_response = await reasoning.respond_with_context(context_messages)
+        prompt = _qa_prompt(initial_response)
+        messages = [{"role": "user", "content": prompt}]
+    else:
+        raise ValueError(f"Tool {tool_name} does not support streaming")
+
+    parts = []
+    async for delta in reasoning.stream_llm_with_messages(messages):
+        parts.append(delta)
+        yield {"type": "delta", "content": delta}
+
+    if tool_name == "qa":
+        streamed = "".join(parts)
+        final = await reasoning.self_corrected_response(prompt, initial=streamed)
+        if final != streamed:
+            yield {"type": "replace", "content": final}
@@ -0,0 +1,68 @@
+# conftest.py - isolated data directory and a local fake LLM for the test suite
+
+"""
+The services read their settings (data paths, NGU_BASE_URL) at import
+time, so the environment is prepared here, before any test module imports
+them: every run works in a fresh temporary directory and talks to
+benchmarks.fake_llm, served on a free local port.
+"""
+
+import atexit
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+FAKE_LLM_PORT = _free_port()
+WORKDIR = tempfile.mkdtemp(prefix="synthesistalk-tests-")
+os.makedirs(os.path.join(WORKDIR, "data"))
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.chdir(WORKDIR)
+os.environ.update(
+    NGU_BASE_URL=f"http://127.0.0.1:{FAKE_LLM_PORT}/v1",
+    NGU_API_KEY="test",
+    NGU_MODEL="fake",
+    SEARCH_PROVIDER="benchmarks.fake_search:FakeSearchProvider",
+    FAKE_SEARCH_LATENCY="0",
+)
+
+
+@pytest.fixture(scope="session")
+def fake_llm():
+    from benchmarks import fake_llm
+
+    fake_llm.config.update(latency=0, token_rate=0, tokens=20)
+    server = uvicorn.Server(uvicorn.Config(fake_llm.app, host="127.0.0.1", port=FAKE_LLM_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield fake_llm
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture(scope="session")
+def client(fake_llm):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
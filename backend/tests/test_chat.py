@@ -0,0 +1,72 @@
+# test_chat.py - chat endpoints against the fake LLM
+
+import json
+import uuid
+
+
+def _user() -> str:
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+
+def _events(response) -> list:
+    return [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+
+
+def test_message_returns_new_messages_and_cursor(client):
+    user = _user()
+    first = client.post("/chat/message", json={"user_id": user, "message": "What is protein folding?"}).json()
+    assert first["reply"] and not first["reply"].startswith("Error")
+    assert [m["role"] for m in first["messages"]] == ["user", "assistant"]
+    assert first["messages"][1]["content"] == first["reply"]
+    assert first["cursor"].startswith("2:")
+
+    # With since=, only the messages after the client's cursor come back
+    second = client.post("/chat/message", json={"user_id": user, "message": "And why does it matter?",
+                                                "since": first["cursor"]}).json()
+    assert [m["content"] for m in second["messages"]] == ["And why does it matter?", second["reply"]]
+    assert second["cursor"].startswith("4:")
+    assert second["has_more"] is False and second["reset"] is False
+
+
+def test_history_paging(client):
+    user = _user()
+    for i in range(3):
+        client.post("/chat/message", json={"user_id": user, "message": f"question {i}"})
+
+    latest = client.get("/chat/history", params={"user_id": user, "limit": 4}).json()
+    assert latest["total"] == 6 and latest["first"] == 2
+    assert [m["content"] for m in latest["messages"]][::2] == ["question 1", "question 2"]
+
+    older = client.get("/chat/history", params={"user_id": user, "before": latest["first"], "limit": 4}).json()
+    assert [m["content"] for m in older["messages"]][0] == "question 0"
+    assert older["first"] == 0
+
+    page = client.get("/chat/history", params={"user_id": user, "since": "0", "limit": 5}).json()
+    assert len(page["messages"]) == 5 and page["has_more"] is True
+    rest = client.get("/chat/history", params={"user_id": user, "since": page["cursor"]}).json()
+    assert len(rest["messages"]) == 1 and rest["has_more"] is False
+    assert rest["cursor"] == latest["cursor"]
+
+    # A cursor from before a reset is detected rather than skipping messages
+    client.post("/tools/convo/reset", json={"user_id": user})
+    client.post("/chat/message", json={"user_id": user, "message": "after reset"})
+    after = client.get("/chat/history", params={"user_id": user, "since": rest["cursor"]}).json()
+    assert after["reset"] is True
+    assert [m["content"] for m in after["messages"]][0] == "after reset"
+
+
+def test_stream_persists_reply(client):
+    user = _user()
+    with client.stream("POST", "/chat/stream", json={"user_id": user, "message": "Summarize graph networks"}) as response:
+        events = _events(response)
+
+    deltas = [e["content"] for e in events if e["type"] == "delta"]
+    done = events[-1]
+    assert deltas and done["type"] == "done"
+    assert done["reply"] == "".join(deltas)
+
+    # Saved before "done": a sync with the returned cursor sees everything
+    history = client.get("/chat/history", params={"user_id": user}).json()
+    assert [(m["role"], m["content"]) for m in history["messages"]] == [
+        ("user", "Summarize graph networks"), ("assistant", done["reply"])]
+    assert history["cursor"] == done["cursor"]
@@ -0,0 +1,12 @@
+# test_storage.py - history and note stores under concurrent writers
+
+import pytest
+
+from benchmarks import storage_stress
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "jsonl"])
+def test_concurrent_writers_lose_nothing(backend):
+    # Several processes, each writing from many threads, as uvicorn workers do
+    problems = storage_stress.run(backend, processes=3, threads=8, ops=150)
+    assert problems == []
@@ -85,7 +85,7 @@ const handleReset = async () => {
               </button>
             </div>
             <div className="p-3">
-              {showContext && <ContextPanel messages={messages} activeTool={activeTool} uploadedDocs={uploadedDocs} />}
+              {showContext && <ContextPanel userId={userId} messages={messages} activeTool={activeTool} uploadedDocs={uploadedDocs} />}
               {showNotes && <NotesPanel userId={userId} />}
             </div>
           </div>
@@ -1,66 +1,179 @@
-import { useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import MessageBubble from './MessageBubble';
 import axios from 'axios';
 import { FiPlus } from 'react-icons/fi';
 
+const STREAMING_TOOLS = ["summarize", "clarify", "qa"];
+
+// POST a JSON body and read the Server-Sent Events reply, calling onEvent
+// for every `data:` payload as it arrives.
+async function streamSSE(url, body, onEvent) {
+  const res = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const event of events) {
+      const line = event.split("\n").find((l) => l.startsWith("data:"));
+      if (line) onEvent(JSON.parse(line.slice(5).trim()));
+    }
+  }
+}
+
+const toBubble = (m) => ({ role: m.role, message: m.content, hash: m.hash });
+
+// Merge messages fetched from /chat/history into the local list. Messages
+// shown optimistically while a turn runs are marked `pending`; each saved
+// message claims the pending one with the same text, or for replies the
+// first pending reply (which keeps its richer local rendering, e.g. chart
+// data). Anything else is appended.
+function mergeDelta(prev, delta) {
+  const merged = [...prev];
+  for (const m of delta) {
+    let i = merged.findIndex((local) => local.pending && local.role === m.role && local.message === m.content);
+    if (i < 0 && m.role === "assistant") i = merged.findIndex((local) => local.pending && local.role === "assistant");
+    if (i >= 0) merged[i] = { ...merged[i], pending: false, hash: m.hash };
+    else merged.push(toBubble(m));
+  }
+  return merged;
+}
+
 function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool, uploadedDocs, setUploadedDocs }) {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
   const [uploading, setUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(null);
+  const [firstLoaded, setFirstLoaded] = useState(0);  // history position of messages[0]
+  const cursorRef = useRef(null);
+
+  // Load the latest page of saved history when the user is known
+  useEffect(() => {
+    if (!userId) return;
+    axios
+      .get("http://localhost:8000/chat/history", { params: { user_id: userId } })
+      .then(({ data }) => {
+        setMessages(data.messages.map(toBubble));
+        setFirstLoaded(data.first);
+        cursorRef.current = data.cursor;
+      })
+      .catch((err) => console.error("History load failed", err));
+  }, [userId]);
+
+  // Fetch only the messages saved since the last sync
+  const syncHistory = async () => {
+    if (!userId || cursorRef.current === null) return;
+    try {
+      let page;
+      do {
+        page = (await axios.get("http://localhost:8000/chat/history", {
+          params: { user_id: userId, since: cursorRef.current },
+        })).data;
+        if (page.reset) {
+          setMessages(page.messages.map(toBubble));
+          setFirstLoaded(page.first);
+        } else {
+          const delta = page.messages;
+          setMessages((prev) => mergeDelta(prev, delta));
+        }
+        cursorRef.current = page.cursor;
+      } while (page.has_more && !page.reset);
+    } catch (err) {
+      console.error("History sync failed", err);
+    }
+  };
+
+  const loadEarlier = async () => {
+    const { data } = await axios.get("http://localhost:8000/chat/history", {
+      params: { user_id: userId, before: firstLoaded },
+    });
+    setMessages((prev) => [...data.messages.map(toBubble), ...prev]);
+    setFirstLoaded(data.first);
+  };
 
   const sendMessage = async () => {
     if (!input.trim() && activeTool !== "visualize") return;
 
     const newMessages = [...messages];
     const userMessage = input.trim() || "[Using Visualize Tool]";
-    newMessages.push({ role: "user", message: userMessage });
+    newMessages.push({ role: "user", message: userMessage, pending: true });
     setMessages(newMessages);
     setInput("");
     setLoading(true);
 
+    // Streaming path: show the reply as it is generated
+    if (!activeTool || STREAMING_TOOLS.includes(activeTool)) {
+      let reply = "";
+      const showReply = (text) =>
+        setMessages([...newMessages, { role: "assistant", message: text, pending: true }]);
+
+      try {
+        const url = activeTool
+          ? "http://localhost:8000/tools/stream"
+          : "http://localhost:8000/chat/stream";
+        const body = activeTool
+          ? { tool_name: activeTool, input_text: userMessage, user_id: userId }
+          : { user_id: userId, message: userMessage };
+
+        await streamSSE(url, body, (event) => {
+          if (event.type === "delta") reply += event.content;
+          else if (event.type === "replace" || event.type === "done") reply = event.content ?? event.reply;
+          showReply(reply);
+        });
+      } catch (err) {
+        showReply(reply || " Error connecting to backend.");
+      } finally {
+        setLoading(false);
+        await syncHistory();
+      }
+      return;
+    }
+
     try {
       let reply, result;
 
-      if (!activeTool) {
-        const res = await axios.post("http://localhost:8000/chat/message", {
-          user_id: userId,
-          message: userMessage,
-        });
-        reply = res.data.reply;
-      } else {
-        let toolInput = input;
+      let toolInput = input;
 
-        if (activeTool === "visualize" && !input.trim()) {
-          const lastAssistant = [...messages].reverse().find(m => m.role === "assistant");
-          if (lastAssistant) {
-            toolInput = lastAssistant.message;
-          }
+      if (activeTool === "visualize" && !input.trim()) {
+        const lastAssistant = [...messages].reverse().find(m => m.role === "assistant");
+        if (lastAssistant) {
+          toolInput = lastAssistant.message;
         }
+      }
 
-        const res = await axios.post("http://localhost:8000/tools/use", {
-          tool_name: activeTool,
-          input_text: toolInput,
-          user_id: userId,
-        });
+      const res = await axios.post("http://localhost:8000/tools/use", {
+        tool_name: activeTool,
+        input_text: toolInput,
+        user_id: userId,
+      });
 
-        if (activeTool === "visualize" && Array.isArray(res.data.result)) {
-          reply = "[VISUALIZE]";
-          result = res.data.result;
-        } else if (activeTool === "search" && Array.isArray(res.data.result)) {
-          reply = res.data.result
-            .map(
-              (item) =>
-                `🔗 ${item.title}\n${item.href}\n${item.body?.slice(0, 150)}...`
-            )
-            .join("\n\n");
-        } else {
-          reply = typeof res.data.result === "string"
-            ? res.data.result
-            : JSON.stringify(res.data.result, null, 2);
-        }
+      if (activeTool === "visualize" && Array.isArray(res.data.result)) {
+        reply = "[VISUALIZE]";
+        result = res.data.result;
+      } else if (activeTool === "search" && Array.isArray(res.data.result)) {
+        reply = res.data.result
+          .map(
+            (item) =>
+              `🔗 ${item.title}\n${item.href}\n${item.body?.slice(0, 150)}...`
+          )
+          .join("\n\n");
+      } else {
+        reply = typeof res.data.result === "string"
+          ? res.data.result
+          : JSON.stringify(res.data.result, null, 2);
       }
 
-      setMessages([...newMessages, { role: "assistant", message: reply, data: result }]);
+      setMessages([...newMessages, { role: "assistant", message: reply, data: result, pending: true }]);
     } catch (err) {
       setMessages([
         ...newMessages,
@@ -68,6 +181,7 @@ function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool,
       ]);
     } finally {
       setLoading(false);
+      await syncHistory();
     }
   };
 
@@ -82,14 +196,18 @@ function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool,
     setUploading(true);
 
     try {
+      // The upload returns a job id right away; poll it until ingestion ends
       const res = await axios.post("http://localhost:8000/tools/upload", formData);
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: "assistant",
-          message: `📄 Uploaded **${res.data.filename}**\n\n📝 Summary:\n${res.data.summary}`
-        }
-      ]);
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`http://localhost:8000/tools/upload/${res.data.job_id}`)).data;
+        setUploadProgress(job.progress);
+      } while (job.status === "queued" || job.status === "running");
+
+      if (job.status !== "done") throw new Error(job.error);
+      // The upload summary was saved to history; pick it up from there
+      await syncHistory();
       setUploadedDocs((prev) => [...prev, file.name]);
     } catch (err) {
       setMessages((prev) => [
@@ -98,6 +216,7 @@ function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool,
       ]);
     } finally {
       setUploading(false);
+      setUploadProgress(null);
     }
   };
 
@@ -110,7 +229,22 @@ function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool,
       input_text: lastAssistant.message
     });
 
-    let filePath = res.data.result.file_path.replace(/\\/g, "/");
+    // An identical export comes back at once; otherwise poll the render job
+    let result = res.data.result;
+    if (!result) {
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 500));
+        job = (await axios.get(`http://localhost:8000/tools/export/${res.data.job_id}`)).data;
+      } while (job.status === "queued" || job.status === "running");
+      if (job.status !== "done") {
+        setMessages((prev) => [...prev, { role: "assistant", message: " Export failed." }]);
+        return;
+      }
+      result = job.result;
+    }
+
+    let filePath = result.file_path.replace(/\\/g, "/");
     const fileName = filePath.split("/").pop();
 
     setMessages((prev) => [
@@ -129,8 +263,15 @@ function ChatWindow({ userId, messages, setMessages, activeTool, setActiveTool,
         {uploading && (
           <div className="text-sm text-blue-400 animate-pulse px-2">
             ⏳ Uploading and analyzing document...
+            {uploadProgress?.pages_total > 0 &&
+              ` (${uploadProgress.pages_extracted}/${uploadProgress.pages_total} pages${uploadProgress.summary_done ? ", summarized" : ""})`}
           </div>
         )}
+        {firstLoaded > 0 && (
+          <button onClick={loadEarlier} className="text-xs text-white/50 hover:text-white px-2">
+            Load earlier messages
+          </button>
+        )}
         {messages.map((msg, i) => (
           <MessageBubble key={i} role={msg.role} message={msg.message} data={msg.data} />
         ))}
@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import axios from 'axios';
 
-function ContextPanel({ messages, activeTool, uploadedDocs }) {
+function ContextPanel({ userId, messages, activeTool, uploadedDocs }) {
   const [topic, setTopic] = useState('New Conversation');
   const [sources, setSources] = useState([]);
   const [isGeneratingTopic, setIsGeneratingTopic] = useState(false);
@@ -20,7 +20,8 @@ function ContextPanel({ messages, activeTool, uploadedDocs }) {
         .join('\n');
 
       const response = await axios.post('http://localhost:8000/tools/generate_topic', {
-        conversation_text: conversationText
+        conversation_text: conversationText,
+        user_id: userId
       });
 
       let generatedTitle = response.data.topic;